@@ -5,11 +5,20 @@ FFmpegを使用して動画から定期的にフレームを抽出し、
 引継ぎドキュメント用のタイムスタンプ付き画像を生成する。
 """
 
+import io
 import os
-import tempfile
+import re
+import math
 import base64
-from pathlib import Path
-from typing import List, Tuple
+import bisect
+import tempfile
+import threading
+import subprocess
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import ffmpeg
 from PIL import Image
@@ -22,111 +31,711 @@ def format_timestamp(seconds: float) -> str:
     return f"{minutes:02d}:{secs:02d}"
 
 
-def get_video_duration(video_path: str) -> float:
-    """動画の長さを秒数で取得"""
+class Frame(NamedTuple):
+    """抽出フレーム（FrameSet から取り出したビュー）"""
+    timestamp: float
+    jpeg: bytes
+
+    @property
+    def timestamp_str(self) -> str:
+        return format_timestamp(self.timestamp)
+
+    def to_base64(self) -> str:
+        """描画時のみBase64に変換する"""
+        return base64.b64encode(self.jpeg).decode("utf-8")
+
+
+class FrameSet:
+    """
+    フレーム列のコンパクトな格納コンテナ
+
+    タイムスタンプは数値配列、JPEGは1本の連続バッファ＋オフセット配列で保持し、
+    フレームごとのタプル・文字列・Base64テキストを持たない。
+    フレームは常にタイムスタンプ順に並び、時刻からの検索は二分探索で行う。
+    """
+
+    __slots__ = ("_timestamps", "_offsets", "_buffer")
+
+    def __init__(self, frames: Iterable[Tuple[float, bytes]] = ()):
+        self._timestamps = array("d")
+        self._offsets = array("Q", [0])
+        self._buffer = bytearray()
+        for timestamp, jpeg in frames:
+            self.add(timestamp, jpeg)
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def __getitem__(self, index: int) -> Frame:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return Frame(self._timestamps[index], bytes(self._buffer[start:end]))
+
+    def __iter__(self) -> Iterator[Frame]:
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def timestamps(self) -> array:
+        return self._timestamps
+
+    @property
+    def nbytes(self) -> int:
+        """保持しているデータのバイト数（概算）"""
+        return (
+            len(self._buffer)
+            + self._timestamps.itemsize * len(self._timestamps)
+            + self._offsets.itemsize * len(self._offsets)
+        )
+
+    def add(self, timestamp: float, jpeg: bytes) -> None:
+        """フレームを時刻順の位置に追加する（通常は末尾への追記）"""
+        position = bisect.bisect_right(self._timestamps, timestamp)
+        if position == len(self):
+            self._timestamps.append(timestamp)
+            self._buffer += jpeg
+            self._offsets.append(len(self._buffer))
+            return
+
+        offset = self._offsets[position]
+        self._timestamps.insert(position, timestamp)
+        self._buffer[offset:offset] = jpeg
+        self._offsets.insert(position + 1, offset + len(jpeg))
+        for i in range(position + 2, len(self._offsets)):
+            self._offsets[i] += len(jpeg)
+
+    def extend(self, frames: Iterable[Tuple[float, bytes]]) -> None:
+        for timestamp, jpeg in frames:
+            self.add(timestamp, jpeg)
+
+    def has_timestamp(self, timestamp: float, tolerance: float = 0.0) -> bool:
+        """timestamp 以前 tolerance 秒以内のフレームがあるか"""
+        position = bisect.bisect_right(self._timestamps, timestamp) - 1
+        return position >= 0 and timestamp - self._timestamps[position] <= tolerance
+
+    def lookup(self, target_seconds: float) -> Optional[Frame]:
+        """
+        指定秒数に対応するフレームを返す
+
+        各フレームは次のフレームまでの区間の画面を表すものとして扱い、
+        指定時刻以前で最も新しいフレームを返す（先頭より前なら先頭フレーム）。
+        """
+        if not len(self):
+            return None
+        position = bisect.bisect_right(self._timestamps, target_seconds) - 1
+        return self[max(position, 0)]
+
+    def clear(self) -> None:
+        self._timestamps = array("d")
+        self._offsets = array("Q", [0])
+        self._buffer = bytearray()
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    """
+    動画ファイルのメディア情報（ffprobe 1回分の結果）
+
+    アップロードごとに1回だけ取得し、各処理段階に渡して再プローブを避ける。
+    """
+    path: str
+    size: int
+    mtime: float
+    duration: float
+    format_name: str = ""
+    bit_rate: Optional[int] = None
+    streams: Tuple[dict, ...] = ()
+    video_codec: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    audio_codec: Optional[str] = None
+    audio_channels: Optional[int] = None
+    audio_sample_rate: Optional[int] = None
+    audio_bit_rate: Optional[int] = None
+    keyframe_interval: Optional[float] = None
+
+    @property
+    def has_video(self) -> bool:
+        return self.video_codec is not None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_codec is not None
+
+
+# キーフレーム間隔の推定に読むパケットの範囲（秒）
+KEYFRAME_PROBE_SECONDS = 60
+
+# probe_media のキャッシュ（パス+サイズ+更新時刻 → MediaInfo）
+MEDIA_INFO_CACHE_SIZE = 64
+_media_info_cache: "OrderedDict[tuple, MediaInfo]" = OrderedDict()
+_media_info_lock = threading.Lock()
+
+
+def _parse_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_frame_rate(value: Optional[str]) -> Optional[float]:
+    """"30000/1001" 形式のフレームレートを数値に変換"""
+    try:
+        num, _, den = (value or "").partition("/")
+        rate = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return rate or None
+
+
+def _probe_keyframe_interval(video_path: str) -> Optional[float]:
+    """冒頭のパケットからキーフレームの平均間隔（秒）を推定する"""
+    try:
+        probe = ffmpeg.probe(
+            video_path,
+            select_streams="v:0",
+            show_entries="packet=pts_time,flags",
+            read_intervals=f"%+{KEYFRAME_PROBE_SECONDS}",
+        )
+    except Exception:
+        return None
+
+    keyframes = sorted(
+        float(packet["pts_time"])
+        for packet in probe.get("packets", [])
+        if "K" in packet.get("flags", "") and packet.get("pts_time") not in (None, "N/A")
+    )
+    if len(keyframes) < 2:
+        return None
+    return (keyframes[-1] - keyframes[0]) / (len(keyframes) - 1)
+
+
+def _parse_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_duration_tag(value: Optional[str]) -> Optional[float]:
+    """Matroskaの DURATION タグ（"00:01:02.345000000" 形式）を秒数に変換"""
+    try:
+        hours, minutes, seconds = (value or "").split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return None
+
+
+def _probe_packet_duration(video_path: str) -> Optional[float]:
+    """パケットの表示時刻を最後まで読み、末尾の時刻から長さを求める（デコードはしない）"""
+    try:
+        probe = ffmpeg.probe(video_path, show_entries="packet=pts_time,duration_time")
+    except Exception:
+        return None
+
+    end = None
+    for packet in probe.get("packets", []):
+        pts = _parse_float(packet.get("pts_time"))
+        if pts is not None:
+            end = max(end or 0.0, pts + (_parse_float(packet.get("duration_time")) or 0.0))
+    return end
+
+
+def _resolve_duration(video_path: str, fmt: dict, streams: Tuple[dict, ...]) -> float:
+    """
+    動画の長さ（秒）を求める
+
+    ブラウザのMediaRecorderで録画したWebMなどはコンテナに長さが記録されていないため、
+    ストリームの長さ → DURATIONタグ → パケットの末尾時刻の順に代わりを探す。
+    """
+    duration = _parse_float(fmt.get("duration"))
+    if duration is None:
+        durations = [d for d in (_parse_float(st.get("duration")) for st in streams) if d is not None]
+        if not durations:
+            durations = [
+                d for d in (_parse_duration_tag(st.get("tags", {}).get("DURATION")) for st in streams)
+                if d is not None
+            ]
+        duration = max(durations) if durations else _probe_packet_duration(video_path)
+
+    if duration is None:
+        raise RuntimeError("動画の長さを取得できません")
+    return duration
+
+
+def _build_media_info(video_path: str, stat: os.stat_result) -> MediaInfo:
+    probe = ffmpeg.probe(video_path)
+    fmt = probe.get("format", {})
+    streams = tuple(probe.get("streams", []))
+
+    video = next((st for st in streams if st.get("codec_type") == "video"), None)
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+
+    return MediaInfo(
+        path=video_path,
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        duration=_resolve_duration(video_path, fmt, streams),
+        format_name=fmt.get("format_name", ""),
+        bit_rate=_parse_int(fmt.get("bit_rate")),
+        streams=streams,
+        video_codec=video.get("codec_name") if video else None,
+        width=_parse_int(video.get("width")) if video else None,
+        height=_parse_int(video.get("height")) if video else None,
+        fps=_parse_frame_rate(video.get("avg_frame_rate")) if video else None,
+        audio_codec=audio.get("codec_name") if audio else None,
+        audio_channels=_parse_int(audio.get("channels")) if audio else None,
+        audio_sample_rate=_parse_int(audio.get("sample_rate")) if audio else None,
+        audio_bit_rate=_parse_int(audio.get("bit_rate")) if audio else None,
+        keyframe_interval=_probe_keyframe_interval(video_path) if video else None,
+    )
+
+
+def probe_media(video_path: str) -> MediaInfo:
+    """
+    動画のメディア情報を取得（パス+サイズ+更新時刻でキャッシュ）
+
+    同じファイルに対する2回目以降の呼び出しはffprobeを起動しない。
+    """
     try:
-        probe = ffmpeg.probe(video_path)
-        duration = float(probe["format"]["duration"])
-        return duration
+        stat = os.stat(video_path)
+        key = (os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns)
+
+        with _media_info_lock:
+            if key in _media_info_cache:
+                _media_info_cache.move_to_end(key)
+                return _media_info_cache[key]
+
+        info = _build_media_info(video_path, stat)
     except Exception as e:
         raise RuntimeError(f"動画情報の取得に失敗しました: {e}")
 
+    with _media_info_lock:
+        _media_info_cache[key] = info
+        while len(_media_info_cache) > MEDIA_INFO_CACHE_SIZE:
+            _media_info_cache.popitem(last=False)
+    return info
+
+
+def get_video_duration(video_path: str) -> float:
+    """動画の長さを秒数で取得"""
+    return probe_media(video_path).duration
+
+
+# フレーム抽出モード
+#   single_pass: 動画を1回だけデコードし、fpsフィルタで全フレームを一括出力
+#   seek: タイムスタンプごとにFFmpegを起動してシーク抽出（旧方式）
+#   scene: single_passで候補を抽出し、画面が変化したフレームのみ残す
+#   keyframe: キーフレームのみデコードし、各サンプル時刻以降で最初のキーフレームを採用
+#             （精度は±1 GOP。実際に採用した時刻をタイムスタンプとして返す）
+EXTRACTION_MODES = ("single_pass", "seek", "scene", "keyframe")
 
-def resize_image(image_path: str, max_width: int = 800) -> None:
-    """画像を指定幅にリサイズ（アスペクト比維持）"""
-    with Image.open(image_path) as img:
-        if img.width > max_width:
-            ratio = max_width / img.width
-            new_height = int(img.height * ratio)
-            resized = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-            resized.save(image_path, optimize=True, quality=85)
+# sceneモードの既定値
+# 知覚ハッシュ（64bit dHash）のハミング距離がこの値以下なら同一画面とみなす
+SCENE_HASH_THRESHOLD = 6
+# 採用フレーム間の最小間隔（秒）
+SCENE_MIN_INTERVAL = 2.0
+# 画面変化がなくてもこの間隔（秒）で1枚は採用する
+SCENE_MAX_INTERVAL = 60.0
+
+# 並列抽出の既定ワーカー数（セグメントごとに1つのFFmpegプロセスを起動）
+DEFAULT_EXTRACTION_WORKERS = os.cpu_count() or 1
+
+# FFmpegのMJPEG品質（-q:v, 2が最高品質）。PILのquality=85相当
+JPEG_QSCALE = 4
+
+# JPEGのマーカー（パイプ出力をフレーム単位に分割するため）
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+# showinfoフィルタのログから表示時刻を取り出す
+SHOWINFO_PTS_PATTERN = re.compile(r"Parsed_showinfo.*?\bpts_time:\s*([-\d.]+)")
+
+# [IMAGE: MM:SS] / [IMAGE: HH:MM:SS] プレースホルダー
+# コロンの前後にスペースが入っていても許容する
+IMAGE_PLACEHOLDER_PATTERN = re.compile(r'\[IMAGE:\s*((?:\d{1,2}:)?\d{1,3}:\d{2})\s*\]')
 
 
 def extract_frames(
     video_path: str,
     interval_seconds: int = 5,
-    max_width: int = 800
-) -> List[Tuple[float, str, str]]:
+    max_width: int = 800,
+    mode: str = "single_pass",
+    similarity_threshold: int = SCENE_HASH_THRESHOLD,
+    min_interval: float = SCENE_MIN_INTERVAL,
+    max_interval: float = SCENE_MAX_INTERVAL,
+    workers: int = 1,
+    media_info: Optional[MediaInfo] = None,
+) -> FrameSet:
     """
     FFmpegでフレーム抽出
 
+    フレームはFFmpeg側で max_width に縮小・JPEGエンコードされ、
+    標準出力経由でメモリ上に受け取る（一時ファイルは作らない）。
+    workers が2以上の場合、single_pass / scene モードでは動画を時間方向の
+    セグメントに分割し、セグメントごとのFFmpegプロセスで並列にデコードする。
+
     Args:
         video_path: 動画ファイルのパス
-        interval_seconds: フレーム抽出間隔（秒）
+        interval_seconds: フレーム抽出間隔（秒）。sceneモードでは候補のサンプリング間隔
         max_width: 画像の最大幅（ピクセル）
+        mode: 抽出モード（"single_pass" / "seek" / "scene" / "keyframe"）
+        similarity_threshold: sceneモードで同一画面とみなすハッシュ距離の上限
+        min_interval: sceneモードで採用フレーム間に空ける最小間隔（秒）
+        max_interval: sceneモードで画面変化がなくても採用する最大間隔（秒）
+        workers: 並列デコードするプロセス数の上限（CPUコア数まで）
+        media_info: 取得済みのメディア情報（省略時はプローブする）
 
     Returns:
-        List of (timestamp_seconds, timestamp_str, base64_image)
+        時刻順のフレーム列（FrameSet）
     """
-    duration = get_video_duration(video_path)
-    frames = []
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"未対応の抽出モードです: {mode}")
 
-    # 一時ディレクトリを作成
-    temp_dir = tempfile.mkdtemp(prefix="hikitsugi_frames_")
+    media_info = media_info or probe_media(video_path)
+    if not media_info.has_video:
+        raise RuntimeError("映像トラックがありません")
 
-    try:
-        # 抽出するタイムスタンプを計算
-        timestamps = []
-        current_time = 0.0
-        while current_time < duration:
-            timestamps.append(current_time)
-            current_time += interval_seconds
-
-        # 各タイムスタンプでフレームを抽出
-        for ts in timestamps:
-            output_path = os.path.join(temp_dir, f"frame_{ts:.0f}.jpg")
-
-            try:
-                (
-                    ffmpeg
-                    .input(video_path, ss=ts)
-                    .output(output_path, vframes=1, format="image2", vcodec="mjpeg")
-                    .overwrite_output()
-                    .run(quiet=True)
-                )
-
-                # 画像リサイズ
-                resize_image(output_path, max_width)
-
-                # Base64変換
-                with open(output_path, "rb") as f:
-                    b64_data = base64.b64encode(f.read()).decode("utf-8")
-
-                frames.append((ts, format_timestamp(ts), b64_data))
-
-            except Exception as e:
-                # 個別フレームの抽出失敗はスキップ
-                print(f"Warning: フレーム抽出失敗 (ts={ts}): {e}")
-                continue
+    duration = media_info.duration
+    workers = max(1, min(workers, DEFAULT_EXTRACTION_WORKERS))
+
+    if mode in ("single_pass", "scene"):
+        if workers > 1:
+            candidates = _run_fps_pass_parallel(video_path, duration, interval_seconds, max_width, workers)
+        else:
+            candidates = _run_fps_pass(video_path, interval_seconds, max_width, end=duration)
+        if mode == "scene":
+            candidates = _select_scene_changes(candidates, similarity_threshold, min_interval, max_interval)
+    elif mode == "keyframe":
+        candidates = _run_keyframe_pass(video_path, duration, interval_seconds, max_width)
+    else:
+        candidates = _run_seek_pass(video_path, duration, interval_seconds, max_width)
+
+    return FrameSet(candidates)
+
+
+def _scale_filter(stream, max_width: int):
+    """max_width を超える場合のみ縮小する（アスペクト比維持、高さは偶数）"""
+    return stream.filter("scale", f"min(iw,{max_width})", -2, flags="lanczos")
+
+
+def _iter_jpeg_stream(pipe, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    """image2pipe で連結出力されたJPEGをフレーム単位に分割する"""
+    buffer = bytearray()
+    scan_from = 0
+
+    while True:
+        chunk = pipe.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+
+        while True:
+            end = buffer.find(JPEG_EOI, scan_from)
+            if end < 0:
+                # マーカーがチャンク境界をまたぐ場合に備えて1バイト戻す
+                scan_from = max(len(buffer) - 1, 0)
+                break
+
+            frame = bytes(buffer[:end + len(JPEG_EOI)])
+            del buffer[:end + len(JPEG_EOI)]
+            scan_from = 0
+            if frame.startswith(JPEG_SOI):
+                yield frame
+
+
+def _run_fps_pass(
+    video_path: str,
+    interval_seconds: float,
+    max_width: int,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    threads: Optional[int] = None,
+) -> Iterator[Tuple[float, bytes]]:
+    """
+    動画の [start, end) 区間を1回デコードし、fpsフィルタで間引いたフレームを順に返す
+
+    Yields:
+        (timestamp_seconds, jpeg_bytes)
+    """
+    input_kwargs = {}
+    if start > 0:
+        input_kwargs["ss"] = start
+    if end is not None:
+        input_kwargs["t"] = end - start
+    if threads:
+        input_kwargs["threads"] = threads
+
+    # fps=1/interval で start, start+interval, ... のフレームを出力
+    stream = ffmpeg.input(video_path, **input_kwargs).filter("fps", fps=f"1/{interval_seconds}", round="up")
+    args = (
+        _scale_filter(stream, max_width)
+        .output("pipe:", format="image2pipe", vcodec="mjpeg", **{"q:v": JPEG_QSCALE})
+        .global_args("-loglevel", "error")
+        .compile()
+    )
+    # エラー出力はパイプにせず一時ファイルへ書かせる
+    # （破損した動画でエラーログがパイプ容量を超えると、標準出力の読み出しと互いに待ち合って止まる）
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=stderr_file)
 
+    completed = False
+    try:
+        for index, jpeg in enumerate(_iter_jpeg_stream(process.stdout)):
+            ts = start + index * interval_seconds
+            if end is not None and ts >= end:
+                break
+            yield ts, jpeg
+        else:
+            completed = True
     finally:
-        # 一時ファイルを削除
-        cleanup_temp_dir(temp_dir)
+        if not completed:
+            # 途中で打ち切った場合はFFmpegを止める
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+        stderr_file.close()
+
+    if completed and returncode != 0:
+        raise ffmpeg.Error("ffmpeg", None, stderr)
+
+
+def _run_fps_pass_parallel(
+    video_path: str,
+    duration: float,
+    interval_seconds: float,
+    max_width: int,
+    workers: int,
+) -> List[Tuple[float, bytes]]:
+    """
+    動画をセグメントに分割し、セグメントごとのFFmpegプロセスで並列に抽出する
+
+    セグメント境界は抽出間隔の倍数に揃えるため、結果は単一パスと同じ
+    タイムスタンプ列になる。
+    """
+    total_samples = math.ceil(duration / interval_seconds)
+    samples_per_segment = max(1, math.ceil(total_samples / workers))
+    segment_length = samples_per_segment * interval_seconds
+
+    segments = []
+    segment_start = 0.0
+    while segment_start < duration:
+        segments.append((segment_start, min(segment_start + segment_length, duration)))
+        segment_start += segment_length
+
+    # FFmpeg内部のデコードスレッドがコア数を超えないよう配分
+    threads = max(1, DEFAULT_EXTRACTION_WORKERS // len(segments))
+
+    def run_segment(segment: Tuple[float, float]) -> List[Tuple[float, bytes]]:
+        seg_start, seg_end = segment
+        return list(_run_fps_pass(video_path, interval_seconds, max_width, seg_start, seg_end, threads))
+
+    # FFmpegが別プロセスでデコードするため、パイプの読み出しはスレッドで十分
+    with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix="frame_extract") as pool:
+        results = list(pool.map(run_segment, segments))
+
+    # セグメント順 = タイムスタンプ順
+    return [frame for segment_frames in results for frame in segment_frames]
 
+
+def _run_keyframe_pass(
+    video_path: str,
+    duration: float,
+    interval_seconds: float,
+    max_width: int,
+) -> List[Tuple[float, bytes]]:
+    """
+    キーフレームのみをデコードし、各サンプル時刻以降で最初のキーフレームを出力する
+
+    非キーフレームはデコードしないため、シーク後にGOP内を順送りする処理が発生しない。
+    採用したキーフレームの実際の表示時刻はshowinfoフィルタのログから取得する。
+
+    Returns:
+        List of (timestamp_seconds, jpeg_bytes)
+    """
+    # n枚目は t >= n*interval を満たす最初のキーフレーム
+    stream = (
+        ffmpeg
+        .input(video_path, skip_frame="nokey")
+        .filter("select", f"gte(t,selected_n*{interval_seconds})")
+        .filter("showinfo")
+    )
+    jpegs, log = (
+        _scale_filter(stream, max_width)
+        .output("pipe:", format="image2pipe", vcodec="mjpeg", vsync="passthrough", **{"q:v": JPEG_QSCALE})
+        .global_args("-nostats")
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+
+    timestamps = [
+        float(match.group(1))
+        for match in SHOWINFO_PTS_PATTERN.finditer(log.decode("utf-8", errors="replace"))
+    ]
+
+    frames = []
+    for ts, jpeg in zip(timestamps, _iter_jpeg_stream(io.BytesIO(jpegs))):
+        if ts >= duration:
+            break
+        frames.append((max(ts, 0.0), jpeg))
     return frames
 
 
-def cleanup_temp_dir(temp_dir: str) -> None:
-    """一時ディレクトリを削除"""
-    import shutil
-    try:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-    except Exception as e:
-        print(f"Warning: 一時ディレクトリ削除失敗: {e}")
+def _run_seek_pass(
+    video_path: str,
+    duration: float,
+    interval_seconds: int,
+    max_width: int,
+) -> Iterator[Tuple[float, bytes]]:
+    """タイムスタンプごとにFFmpegを起動してシーク抽出する"""
+    # 抽出するタイムスタンプを計算
+    timestamps = []
+    current_time = 0.0
+    while current_time < duration:
+        timestamps.append(current_time)
+        current_time += interval_seconds
+
+    # 各タイムスタンプでフレームを抽出
+    for ts in timestamps:
+        try:
+            jpeg = extract_frame_at(video_path, ts, max_width)
+        except Exception as e:
+            # 個別フレームの抽出失敗はスキップ
+            print(f"Warning: フレーム抽出失敗 (ts={ts}): {e}")
+            continue
+        yield ts, jpeg
+
+
+def extract_frame_at(video_path: str, timestamp: float, max_width: int = 800) -> bytes:
+    """指定時刻のフレームを1枚、JPEGバイト列として取得する"""
+    stream = ffmpeg.input(video_path, ss=timestamp)
+    jpeg, _ = (
+        _scale_filter(stream, max_width)
+        .output("pipe:", vframes=1, format="image2pipe", vcodec="mjpeg", **{"q:v": JPEG_QSCALE})
+        .run(capture_stdout=True, quiet=True)
+    )
+    if not jpeg:
+        raise RuntimeError(f"フレームが取得できませんでした (ts={timestamp})")
+    return jpeg
+
+
+def extract_frames_at(
+    video_path: str,
+    timestamps: Iterable[float],
+    max_width: int = 800,
+    workers: int = DEFAULT_EXTRACTION_WORKERS,
+) -> FrameSet:
+    """
+    指定した時刻のフレームだけをシーク抽出する（並列）
+
+    ドキュメントのプレースホルダーで参照された時刻のみを取り出す遅延抽出用。
+    抽出に失敗した時刻はスキップする。
+
+    Returns:
+        時刻順のフレーム列（FrameSet）
+    """
+    targets = sorted(set(timestamps))
+    if not targets:
+        return FrameSet()
+
+    def run(ts: float) -> Optional[Tuple[float, bytes]]:
+        try:
+            return ts, extract_frame_at(video_path, ts, max_width)
+        except Exception as e:
+            print(f"Warning: フレーム抽出失敗 (ts={ts}): {e}")
+            return None
+
+    max_workers = max(1, min(workers, DEFAULT_EXTRACTION_WORKERS, len(targets)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frame_extract") as pool:
+        results = list(pool.map(run, targets))
+
+    return FrameSet(filter(None, results))
+
+
+def compute_dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """画像の知覚ハッシュ（dHash）を計算する"""
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = list(gray.getdata())
 
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
 
-def cleanup_frames(frames: List[Tuple[float, str, str]]) -> None:
+
+def hamming_distance(a: int, b: int) -> int:
+    """2つのハッシュ値のハミング距離"""
+    return bin(a ^ b).count("1")
+
+
+def _select_scene_changes(
+    candidates: Iterable[Tuple[float, bytes]],
+    similarity_threshold: int,
+    min_interval: float,
+    max_interval: float,
+) -> Iterator[Tuple[float, bytes]]:
+    """画面が変化したフレームのみを残す（知覚ハッシュで重複除去）"""
+    last_hash = None
+    last_ts = None
+
+    for ts, jpeg in candidates:
+        try:
+            with Image.open(io.BytesIO(jpeg)) as img:
+                img.draft("L", (64, 64))
+                frame_hash = compute_dhash(img)
+        except Exception as e:
+            print(f"Warning: フレーム抽出失敗 (ts={ts}): {e}")
+            continue
+
+        if last_hash is not None:
+            elapsed = ts - last_ts
+            if elapsed < min_interval:
+                continue
+            changed = hamming_distance(frame_hash, last_hash) > similarity_threshold
+            if not changed and elapsed < max_interval:
+                continue
+
+        # 直前に採用したフレームと比較するため、候補ごとではなく採用時のみ更新
+        last_hash = frame_hash
+        last_ts = ts
+        yield ts, jpeg
+
+
+def cleanup_frames(frames: FrameSet) -> None:
     """フレームデータをクリア（メモリ解放用）"""
     frames.clear()
 
 
-def generate_markdown_table(frames: List[Tuple[float, str, str]]) -> str:
+def frame_image_src(frame: Frame, image_url: Optional[Callable[[bytes], str]] = None) -> str:
+    """
+    フレーム画像の参照先を返す
+
+    image_url が指定されていればJPEGバイト列を渡してURLを取得し、
+    指定がなければBase64のdata URIとしてインライン化する。
+    """
+    if image_url is not None:
+        return image_url(frame.jpeg)
+    return f"data:image/jpeg;base64,{frame.to_base64()}"
+
+
+def generate_markdown_table(
+    frames: FrameSet,
+    image_url: Optional[Callable[[bytes], str]] = None,
+) -> str:
     """
     フレームからMarkdownテーブルを生成
 
     Args:
-        frames: List of (timestamp_seconds, timestamp_str, base64_image)
+        frames: 抽出済みのフレーム列
+        image_url: JPEGバイト列から画像URLを返す関数（省略時はBase64埋め込み）
 
     Returns:
         Markdown形式のテーブル文字列
@@ -139,28 +748,28 @@ def generate_markdown_table(frames: List[Tuple[float, str, str]]) -> str:
         "|:-------------:|:-------------:|"
     ]
 
-    for ts_sec, ts_str, b64_img in frames:
-        # インライン画像（Base64埋め込み）
-        img_tag = f"![{ts_str}](data:image/jpeg;base64,{b64_img})"
+    for frame in frames:
+        ts_str = frame.timestamp_str
+        img_tag = f"![{ts_str}]({frame_image_src(frame, image_url)})"
         lines.append(f"| {ts_str} | {img_tag} |")
 
     return "\n".join(lines)
 
 
-def generate_frames_summary(frames: List[Tuple[float, str, str]]) -> str:
+def generate_frames_summary(frames: FrameSet) -> str:
     """フレーム抽出のサマリーを生成"""
     if not frames:
         return "フレームが抽出されていません。"
 
     total_frames = len(frames)
-    first_ts = frames[0][1]
-    last_ts = frames[-1][1]
+    first_ts = format_timestamp(frames.timestamps[0])
+    last_ts = format_timestamp(frames.timestamps[-1])
 
     return f"抽出フレーム数: {total_frames}枚 ({first_ts} ～ {last_ts})"
 
 
 def parse_timestamp_str(time_str: str) -> float:
-    """MM:SS形式の文字列を秒数（float）に変換"""
+    """MM:SS / HH:MM:SS形式の文字列を秒数（float）に変換"""
     try:
         parts = time_str.split(':')
         if len(parts) == 2:
@@ -172,82 +781,282 @@ def parse_timestamp_str(time_str: str) -> float:
     return 0.0
 
 
-def find_closest_frame(target_time_str: str, frames: List[Tuple[float, str, str]]) -> Tuple[float, str, str]:
+# 角括弧内の時刻（[MM:SS]、[MM:SS-MM:SS] など）
+_BRACKETED_PATTERN = re.compile(r'\[[^\[\]\n]*\]')
+_TIMESTAMP_TOKEN_PATTERN = re.compile(r'(?<![\d:])((?:\d{1,2}:)?\d{1,3}:\d{2})(?![\d:])')
+
+
+def shift_timestamps(markdown_text: str, offset: float) -> str:
+    """角括弧内の MM:SS 時刻に offset 秒を加える（区間ごとの解析結果を元動画の時刻に戻す）"""
+
+    def shift_token(match):
+        return format_timestamp(parse_timestamp_str(match.group(1)) + offset)
+
+    def shift_bracket(match):
+        return _TIMESTAMP_TOKEN_PATTERN.sub(shift_token, match.group(0))
+
+    return _BRACKETED_PATTERN.sub(shift_bracket, markdown_text)
+
+
+def collect_placeholder_timestamps(markdown_text: str) -> List[float]:
+    """Markdown内の [IMAGE: MM:SS] プレースホルダーが参照する時刻（秒, 重複なし）"""
+    return sorted({
+        parse_timestamp_str(match.group(1))
+        for match in IMAGE_PLACEHOLDER_PATTERN.finditer(markdown_text)
+    })
+
+
+def find_closest_frame(target_time_str: str, frames: FrameSet) -> Optional[Frame]:
     """
-    指定された時刻文字列に最も近いフレームを探す
-    
+    指定された時刻文字列に対応するフレームを探す
+
+    指定時刻以前で最も新しいフレームを返す（sceneモードで間引いた
+    フレーム列でも、その時刻に表示されていた画面が選ばれる）。
+    指定時刻が先頭フレームより前の場合は先頭フレームを返す。
+
     Args:
-        target_time_str: "MM:SS" 形式の文字列
-        frames: List of (timestamp_seconds, timestamp_str, base64_image)
-        
+        target_time_str: "MM:SS" または "HH:MM:SS" 形式の文字列
+        frames: 抽出済みのフレーム列
+
     Returns:
-        最も近いフレームのデータタプル
+        対応するフレーム
     """
-    if not frames:
-        return None
-        
-    target_seconds = parse_timestamp_str(target_time_str)
-    
-    # 時間差が最小のフレームを探す
-    closest_frame = min(frames, key=lambda x: abs(x[0] - target_seconds))
-    return closest_frame
+    return frames.lookup(parse_timestamp_str(target_time_str))
 
 
-def replace_image_placeholders(markdown_text: str, frames: List[Tuple[float, str, str]]) -> str:
+def replace_image_placeholders(
+    markdown_text: str,
+    frames: FrameSet,
+    image_url: Optional[Callable[[bytes], str]] = None,
+) -> str:
     """
-    Markdown内の [IMAGE: MM:SS] プレースホルダーを実際の画像(Base64)に置換する
+    Markdown内の [IMAGE: MM:SS] プレースホルダーを実際の画像に置換する
+
+    image_url を指定した場合は画像URLで参照し、省略時はBase64で埋め込む。
     """
     if not frames:
         return markdown_text
-        
-    import re
-    
+
     def replacer(match):
         time_str = match.group(1)
-        # 最も近いフレームを探す
-        frame = find_closest_frame(time_str, frames)
+        # 対応するフレームを探す
+        frame = frames.lookup(parse_timestamp_str(time_str))
         if frame:
-            ts_str = frame[1]
-            b64_data = frame[2]
+            ts_str = frame.timestamp_str
+            src = frame_image_src(frame, image_url)
             # Markdown画像形式に置換
-            return f"\n\n![{ts_str}](data:image/jpeg;base64,{b64_data})\n*（{ts_str}の画面）*\n"
+            return f"\n\n![{ts_str}]({src})\n*（{ts_str}の画面）*\n"
         else:
             return f"(画像が見つかりませんでした: {time_str})"
 
-    # [IMAGE: MM:SS] のパターンを検索して置換
-    # コロンの前後にスペースが入っていても許容する
-    pattern = r'\[IMAGE:\s*(\d{1,2}:\d{2})\]'
-    
-    new_text = re.sub(pattern, replacer, markdown_text)
-    return new_text
+    return IMAGE_PLACEHOLDER_PATTERN.sub(replacer, markdown_text)
 
 
-def clip_video_head(video_path: str, output_path: str, duration: int = 300) -> None:
+# 途中で途切れている可能性のあるプレースホルダー（"[IM" や "[IMAGE: 01:" など）
+_PARTIAL_PLACEHOLDER_PATTERN = re.compile(r'\[(?:I(?:M(?:A(?:G(?:E(?::[\s\d:]*)?)?)?)?)?)?$')
+
+
+class PlaceholderStreamBuffer:
+    """
+    ストリーミング出力を、[IMAGE: MM:SS] の途中で切れない位置までずつ取り出すバッファ
+
+    チャンクの境界をまたぐプレースホルダーは、閉じ括弧が届くまで保留する。
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        """チャンクを追加し、置換してよい（プレースホルダーが完結している）部分を返す"""
+        text = self._pending + chunk
+        match = _PARTIAL_PLACEHOLDER_PATTERN.search(text)
+        if match:
+            self._pending = text[match.start():]
+            return text[:match.start()]
+        self._pending = ""
+        return text
+
+    def flush(self) -> str:
+        """保留中の残りを返す（ストリーム終了時）"""
+        text, self._pending = self._pending, ""
+        return text
+
+
+# MP4コンテナにそのまま格納できるコーデック（ストリームコピー判定用）
+MP4_VIDEO_CODECS = {"h264", "hevc", "mpeg4", "av1"}
+MP4_AUDIO_CODECS = {"aac", "mp3", "opus", "alac"}
+
+
+def _clip_copy_kwargs(media_info: Optional[MediaInfo]) -> Optional[dict]:
+    """クリップ出力のコピー設定（コピーできない場合はNone = 再エンコード）"""
+    if media_info is None:
+        return {"c": "copy"}
+    if media_info.video_codec not in MP4_VIDEO_CODECS:
+        # 映像をコピーできないコンテナ/コーデックは最初から再エンコード
+        return None
+    if media_info.has_audio and media_info.audio_codec not in MP4_AUDIO_CODECS:
+        # 映像のみコピーし、音声はAACに変換
+        return {"vcodec": "copy", "acodec": "aac"}
+    return {"c": "copy"}
+
+
+def clip_video_head(
+    video_path: str,
+    output_path: str,
+    duration: int = 300,
+    media_info: Optional[MediaInfo] = None,
+) -> None:
     """
-    動画の冒頭N秒を切り出す（再エンコードなしで高速処理）
+    動画の冒頭N秒を切り出す（可能な場合は再エンコードなしで高速処理）
 
     Args:
         video_path: 入力動画パス
         output_path: 出力動画パス
         duration: 切り出す秒数（デフォルト300秒=5分）
+        media_info: 取得済みのメディア情報（コーデックからコピー可否を判定）
     """
+    copy_kwargs = _clip_copy_kwargs(media_info)
+
+    if copy_kwargs is not None:
+        try:
+            (
+                ffmpeg
+                .input(video_path, ss=0, t=duration, accurate_seek=None)
+                .output(output_path, avoid_negative_ts="make_zero", **copy_kwargs)
+                .overwrite_output()
+                .run(quiet=True)
+            )
+            return
+        except ffmpeg.Error:
+            # copyで失敗した場合は再エンコードを試みる（安全策）
+            pass
+
     try:
         (
             ffmpeg
-            .input(video_path, ss=0, t=duration, accurate_seek=None)
-            .output(output_path, c="copy", avoid_negative_ts="make_zero")
+            .input(video_path, ss=0, t=duration)
+            .output(output_path)
             .overwrite_output()
             .run(quiet=True)
         )
-    except ffmpeg.Error:
-        # copyで失敗した場合は再エンコードを試みる（安全策）
-        try:
-            (
-                ffmpeg
-                .input(video_path, ss=0, t=duration)
-                .output(output_path)
-                .overwrite_output()
-                .run(quiet=True)
+    except ffmpeg.Error as e2:
+        raise RuntimeError(f"動画クリッピング失敗: {e2}")
+
+
+# 解析用プロキシ動画の設定（Geminiは動画を約1fpsでサンプリングする）
+PROXY_MAX_WIDTH = 1280
+PROXY_FPS = 1
+PROXY_CRF = 28
+
+
+def encode_proxy_video(
+    video_path: str,
+    output_path: str,
+    max_width: int = PROXY_MAX_WIDTH,
+    fps: float = PROXY_FPS,
+    media_info: Optional[MediaInfo] = None,
+    start: float = 0.0,
+    duration: Optional[float] = None,
+) -> None:
+    """
+    解析用の軽量なプロキシ動画(MP4)を作成する
+
+    映像は縮小・低フレームレートの静止画向けH.264に再エンコードし、
+    音声はMP4に格納できるコーデックならそのままコピーする。
+    時刻は元動画と同じため、解析結果のタイムスタンプは補正不要。
+    start/duration を指定した場合はその区間を切り出す（出力の時刻は start が0秒）。
+    """
+    input_kwargs = {"ss": start} if start else {}
+    if duration is not None:
+        input_kwargs["t"] = duration
+    stream = ffmpeg.input(video_path, **input_kwargs)
+    video = _scale_filter(stream.video.filter("fps", fps=fps), max_width)
+
+    audio_codec = "aac"
+    if media_info is not None and media_info.audio_codec in MP4_AUDIO_CODECS:
+        audio_codec = "copy"
+
+    try:
+        (
+            ffmpeg
+            .output(
+                video, stream["a?"], output_path,
+                vcodec="libx264", preset="veryfast", tune="stillimage",
+                crf=PROXY_CRF, pix_fmt="yuv420p",
+                acodec=audio_codec, movflags="+faststart",
             )
-        except ffmpeg.Error as e2:
-            raise RuntimeError(f"動画クリッピング失敗: {e2}")
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"プロキシ動画の作成失敗: {e.stderr.decode('utf-8', errors='replace') if e.stderr else e}")
+
+
+def extract_head_assets(
+    video_path: str,
+    duration: int = 300,
+    audio_path: Optional[str] = None,
+    audio_kwargs: Optional[dict] = None,
+    clip_path: Optional[str] = None,
+    frame_interval: Optional[float] = None,
+    max_width: int = 800,
+    media_info: Optional[MediaInfo] = None,
+) -> FrameSet:
+    """
+    動画冒頭の音声・クリップ・フレームを1回のFFmpeg実行でまとめて出力する
+
+    入力の冒頭N秒を1度だけデマックスし、指定された出力（音声ファイル、
+    クリップ動画、標準出力へのフレーム）を同じフィルタグラフから生成する。
+    冒頭部分を処理ごとに読み直すディスクI/Oとデコードを省く。
+
+    Args:
+        video_path: 入力動画パス
+        duration: 対象とする冒頭の秒数
+        audio_path: 音声の出力先（省略時は出力しない）
+        audio_kwargs: 音声出力のFFmpegオプション（コーデック等）
+        clip_path: クリップ動画の出力先（省略時は出力しない）
+        frame_interval: フレーム抽出間隔（秒, 省略時は抽出しない）
+        max_width: フレームの最大幅
+        media_info: 取得済みのメディア情報
+
+    Returns:
+        冒頭部分のフレーム列（frame_interval 省略時は空）
+    """
+    media_info = media_info or probe_media(video_path)
+    source = ffmpeg.input(video_path, t=duration)
+    outputs = []
+
+    if audio_path and media_info.has_audio:
+        outputs.append(source["a:0"].output(audio_path, **(audio_kwargs or {})))
+
+    if clip_path:
+        clip_kwargs = _clip_copy_kwargs(media_info) or {}
+        outputs.append(ffmpeg.output(source, clip_path, avoid_negative_ts="make_zero", **clip_kwargs))
+
+    with_frames = bool(frame_interval) and media_info.has_video
+    if with_frames:
+        stream = source.video.filter("fps", fps=f"1/{frame_interval}", round="up")
+        outputs.append(
+            _scale_filter(stream, max_width)
+            .output("pipe:", format="image2pipe", vcodec="mjpeg", **{"q:v": JPEG_QSCALE})
+        )
+
+    if not outputs:
+        return FrameSet()
+
+    stdout, _ = (
+        ffmpeg
+        .merge_outputs(*outputs)
+        .overwrite_output()
+        .run(capture_stdout=with_frames, quiet=True)
+    )
+
+    if not with_frames:
+        return FrameSet()
+
+    end = min(duration, media_info.duration)
+    return FrameSet(
+        (index * frame_interval, jpeg)
+        for index, jpeg in enumerate(_iter_jpeg_stream(io.BytesIO(stdout)))
+        if index * frame_interval < end
+    )
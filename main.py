@@ -11,8 +11,9 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from dotenv import load_dotenv
 
-from routes import upload, questions, document
+from routes import upload, questions, document, frames
 from services.session import cleanup_old_sessions
+from services.frame_store import cleanup_old_frames
 
 load_dotenv()
 
@@ -23,6 +24,7 @@ BASE_DIR = Path(__file__).resolve().parent
 async def lifespan(app: FastAPI):
     # 起動時: 古いセッションをクリーンアップ
     cleanup_old_sessions()
+    cleanup_old_frames()
     yield
     # 終了時: 必要に応じてクリーンアップ
 
@@ -44,6 +46,7 @@ templates = Jinja2Templates(directory=BASE_DIR / "templates")
 app.include_router(upload.router, prefix="/api", tags=["upload"])
 app.include_router(questions.router, prefix="/api", tags=["questions"])
 app.include_router(document.router, prefix="/api", tags=["document"])
+app.include_router(frames.router, tags=["frames"])
 
 
 @app.get("/")
@@ -1,26 +1,80 @@
 """
 ドキュメント生成関連のルート
 """
+import os
+import json
 import asyncio
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 from services.session import get_session, ProcessingPhase
-from services.gemini import generate_document, analyze_video_full
-from frame_extractor import replace_image_placeholders
+from services.rate_limit import current_session_id
+from services.gemini import generate_document, stream_document, analyze_video_full
+from services.frame_store import frame_url, inline_frame_urls
+from frame_extractor import (
+    replace_image_placeholders,
+    collect_placeholder_timestamps,
+    extract_frames_at,
+    PlaceholderStreamBuffer,
+)
 
 router = APIRouter()
 
+# 抽出済みフレームで代用する時刻の許容差（秒）
+# アップロード時に冒頭部分を2秒間隔で抽出しているため、その範囲は再抽出しない
+LAZY_FRAME_TOLERANCE = 2.0
+
+# 画像の参照形式
+#   url: /frames/{hash}.jpg で参照（既定）
+#   base64: data URIで埋め込み（単体ファイルとしてのエクスポート用）
+IMAGE_FORMATS = ("url", "base64")
+
 
 class DocumentRequest(BaseModel):
     """ドキュメント生成リクエスト"""
     session_id: str
+    image_format: str = "url"
+
+
+async def _ensure_placeholder_frames(session, document: str) -> None:
+    """
+    ドキュメントが参照する時刻のフレームだけを抽出してセッションにキャッシュする
+
+    抽出済みの時刻は再抽出しないため、ドキュメントを再生成しても
+    新しく参照された時刻の分だけ抽出する。
+    """
+    if not session.file_path or not os.path.exists(session.file_path):
+        return
+
+    frames = session.extracted_frames
+    missing = [ts for ts in collect_placeholder_timestamps(document) if not frames.has_timestamp(ts, LAZY_FRAME_TOLERANCE)]
+    if not missing:
+        return
+
+    loop = asyncio.get_event_loop()
+    new_frames = await loop.run_in_executor(
+        None,
+        lambda: extract_frames_at(session.file_path, missing)
+    )
+
+    frames.extend(new_frames)
+    session.update()
+
+
+def _render_document(document: str, image_format: str) -> str:
+    """保存済みドキュメントを指定の画像形式で返す"""
+    if image_format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"未対応の画像形式です: {image_format}")
+    if image_format == "base64":
+        return inline_frame_urls(document)
+    return document
 
 
 @router.post("/generate-document")
 async def generate_doc(request: DocumentRequest):
     """引継ぎドキュメントを生成"""
+    current_session_id.set(request.session_id)
     session = get_session(request.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="セッションが見つかりません")
@@ -28,6 +82,9 @@ async def generate_doc(request: DocumentRequest):
     if not session.video_analysis:
         raise HTTPException(status_code=400, detail="動画解析が完了していません")
 
+    if request.image_format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"未対応の画像形式です: {request.image_format}")
+
     try:
         # ドキュメント生成
         document = await generate_document(
@@ -35,31 +92,95 @@ async def generate_doc(request: DocumentRequest):
             session.user_policy
         )
 
-        # 画像プレースホルダーを置換
+        # 参照されている時刻のフレームだけを抽出
+        await _ensure_placeholder_frames(session, document)
+
+        # 画像プレースホルダーを置換（セッションにはURL参照の形で保存）
         if session.extracted_frames:
-            document = replace_image_placeholders(document, session.extracted_frames)
+            document = replace_image_placeholders(document, session.extracted_frames, image_url=frame_url)
 
         session.generated_document = document
         session.update()
 
         return JSONResponse({
             "status": "success",
-            "document": document,
+            "document": _render_document(document, request.image_format),
         })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/document-stream/{session_id}")
+async def stream_doc(session_id: str, request: Request):
+    """
+    引継ぎドキュメントを生成しながらSSEで配信
+
+    画像プレースホルダーは完結した分から順に置換して送り、
+    生成が最後まで終わった時点でセッションに保存する。
+    """
+    current_session_id.set(session_id)
+    session = get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="セッションが見つかりません")
+
+    if not session.video_analysis:
+        raise HTTPException(status_code=400, detail="動画解析が完了していません")
+
+    async def generate():
+        buffer = PlaceholderStreamBuffer()
+        rendered = []
+
+        async def render(text: str) -> str:
+            await _ensure_placeholder_frames(session, text)
+            if session.extracted_frames:
+                text = replace_image_placeholders(text, session.extracted_frames, image_url=frame_url)
+            rendered.append(text)
+            return text
+
+        try:
+            async for chunk in stream_document(session.video_analysis, session.user_policy):
+                # クライアント切断時は途中までのドキュメントを保存しない
+                if await request.is_disconnected():
+                    return
+
+                text = buffer.feed(chunk)
+                if text:
+                    text = await render(text)
+                    yield f"event: chunk\ndata: {json.dumps({'text': text})}\n\n"
+
+            text = buffer.flush()
+            if text:
+                text = await render(text)
+                yield f"event: chunk\ndata: {json.dumps({'text': text})}\n\n"
+
+            session.generated_document = "".join(rendered)
+            session.update()
+            yield f"event: done\ndata: {json.dumps({'status': 'success'})}\n\n"
+
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
 @router.get("/document/{session_id}")
-async def get_document(session_id: str):
+async def get_document(session_id: str, image_format: str = "url"):
     """生成済みドキュメントを取得"""
     session = get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="セッションが見つかりません")
 
     return JSONResponse({
-        "document": session.generated_document,
+        "document": _render_document(session.generated_document, image_format),
         "video_analysis": session.video_analysis,
     })
 
@@ -67,6 +188,7 @@ async def get_document(session_id: str):
 @router.post("/analyze/{session_id}")
 async def analyze_video(session_id: str):
     """動画の詳細解析を開始"""
+    current_session_id.set(session_id)
     session = get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="セッションが見つかりません")
@@ -74,22 +196,17 @@ async def analyze_video(session_id: str):
     # アップロード状態を確認
     if session.upload_status == "pending":
         raise HTTPException(status_code=400, detail="動画のアップロードがまだ開始されていません")
-    elif session.upload_status == "failed":
-        raise HTTPException(status_code=500, detail=f"動画のアップロードに失敗しました: {session.upload_error}")
 
     # アップロードが完了していない場合は待機
-    if session.upload_status == "uploading":
-        # 最大60秒待機
-        max_wait = 60
-        waited = 0
-        while session.upload_status == "uploading" and waited < max_wait:
-            await asyncio.sleep(2)
-            waited += 2
-
-        if session.upload_status != "completed":
-            raise HTTPException(status_code=408, detail="動画のアップロード完了待機がタイムアウトしました")
-
-    if not session.gemini_file:
+    try:
+        await session.wait_for_upload()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=408, detail="動画のアップロード完了待機がタイムアウトしました")
+
+    if session.upload_status == "failed":
+        raise HTTPException(status_code=500, detail=f"動画のアップロードに失敗しました: {session.upload_error}")
+
+    if not session.gemini_file and not session.gemini_segments:
         raise HTTPException(status_code=400, detail="動画がアップロードされていません")
 
     # 詳細解析を開始
@@ -97,8 +214,14 @@ async def analyze_video(session_id: str):
     session.update()
 
     try:
+        # 並行して実行中の全編文字起こしを待つ（時間内に終わらなければ文字起こしなしで解析）
+        await session.wait_for_transcript()
+
         # 詳細解析を実行
-        video_analysis = await analyze_video_full(session.gemini_file, session.user_policy)
+        video_analysis = await analyze_video_full(
+            session.gemini_file, session.user_policy, session.full_transcript,
+            segments=session.gemini_segments,
+        )
         session.video_analysis = video_analysis
         session.phase = ProcessingPhase.COMPLETE
         session.update()
@@ -0,0 +1,26 @@
+"""
+フレーム画像配信のルート
+"""
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from services.frame_store import get_frame_path
+
+router = APIRouter()
+
+
+@router.get("/frames/{digest}.jpg")
+async def get_frame(digest: str):
+    """コンテンツアドレスでフレーム画像を配信（内容が変わらないため長期キャッシュ可）"""
+    path = get_frame_path(digest)
+    if path is None:
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+
+    return FileResponse(
+        path,
+        media_type="image/jpeg",
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{digest}"',
+        },
+    )
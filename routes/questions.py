@@ -9,6 +9,7 @@ from fastapi.responses import StreamingResponse, HTMLResponse
 from pydantic import BaseModel
 
 from services.session import get_session, ProcessingPhase
+from services.rate_limit import current_session_id
 from services.gemini import analyze_video_full, CONVERSATIONAL_QUESTIONS
 
 router = APIRouter()
@@ -110,19 +111,35 @@ async def update_policy(request: PolicyUpdateRequest):
 @router.post("/analyze/{session_id}")
 async def start_analysis(session_id: str):
     """詳細解析を開始"""
+    current_session_id.set(session_id)
     session = get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="セッションが見つかりません")
 
-    if not session.gemini_file:
+    # スコーピングと並行して実行中のアップロードを待つ
+    try:
+        await session.wait_for_upload()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=408, detail="動画のアップロード完了待機がタイムアウトしました")
+
+    if session.upload_status == "failed":
+        raise HTTPException(status_code=500, detail=f"動画のアップロードに失敗しました: {session.upload_error}")
+
+    if not session.gemini_file and not session.gemini_segments:
         raise HTTPException(status_code=400, detail="動画がアップロードされていません")
 
     try:
         session.phase = ProcessingPhase.ANALYZING
         session.update()
 
+        # 並行して実行中の全編文字起こしを待つ（時間内に終わらなければ文字起こしなしで解析）
+        await session.wait_for_transcript()
+
         # 詳細解析を実行
-        result = await analyze_video_full(session.gemini_file, session.user_policy)
+        result = await analyze_video_full(
+            session.gemini_file, session.user_policy, session.full_transcript,
+            segments=session.gemini_segments,
+        )
         session.video_analysis = result
         session.phase = ProcessingPhase.COMPLETE
         session.update()
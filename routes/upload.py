@@ -11,21 +11,43 @@ from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPExce
 from fastapi.responses import JSONResponse
 
 from services.session import get_or_create_session, ProcessingPhase
-from services.gemini import upload_video_to_gemini, analyze_video_scoping, analyze_audio_scoping_from_video
-from frame_extractor import extract_frames, clip_video_head
+from services.rate_limit import current_session_id
+from services.gemini import (
+    upload_video_to_gemini,
+    upload_video_segments,
+    use_segmented_analysis,
+    analyze_video_scoping,
+    analyze_audio_scoping_from_video,
+    prepare_scoping_assets,
+    transcribe_full_video,
+    format_transcript,
+)
+from frame_extractor import extract_frames, clip_video_head, probe_media
 
 router = APIRouter()
 
 # アップロード上限（2GB）
 MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024
 
+# スコーピングと同時に抽出する冒頭フレームの間隔（秒）
+HEAD_FRAME_INTERVAL = 2
+
+# 全編の文字起こしを行うか（詳細解析の参考情報として使う）
+FULL_TRANSCRIPTION_ENABLED = os.getenv("FULL_TRANSCRIPTION_ENABLED", "").lower() in ("1", "true", "yes")
+
 # 一時ファイル保存先
 TEMP_DIR = Path(tempfile.gettempdir()) / "hikitsugi_uploads"
 TEMP_DIR.mkdir(exist_ok=True)
 
 
-def process_video_background(session_id: str, file_path: str, mime_type: str):
-    """バックグラウンドで動画を処理（同期ラッパー）"""
+async def process_video_background(session_id: str, file_path: str, mime_type: str):
+    """
+    バックグラウンドで動画を処理
+
+    メインのイベントループ上で実行する。Geminiの非同期クライアントはループに紐づくため、
+    また処理中に作成したタスク（アップロード・全編文字起こし）が処理完了後も続くようにするため、
+    asyncio.run で別ループを作らない。
+    """
     import logging
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
@@ -36,20 +58,20 @@ def process_video_background(session_id: str, file_path: str, mime_type: str):
     if os.path.exists(file_path):
         logger.info(f"File size: {os.path.getsize(file_path)} bytes")
     try:
-        asyncio.run(_process_video_async(session_id, file_path, mime_type))
+        await _process_video_async(session_id, file_path, mime_type)
         logger.info(f"Background processing completed for session {session_id}")
     except Exception as e:
         logger.error(f"Background processing failed: {e}", exc_info=True)
 
 
-def upload_video_background(session_id: str, file_path: str, mime_type: str):
-    """バックグラウンドで動画をGeminiにアップロード（同期ラッパー）"""
+async def upload_video_background(session_id: str, file_path: str, mime_type: str):
+    """バックグラウンドで動画をGeminiにアップロード"""
     import logging
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
     logger.info(f"Starting background video upload for session {session_id}")
     try:
-        asyncio.run(_upload_video_async(session_id, file_path, mime_type))
+        await _upload_video_async(session_id, file_path, mime_type)
         logger.info(f"Background video upload completed for session {session_id}")
     except Exception as e:
         logger.error(f"Background video upload failed: {e}", exc_info=True)
@@ -62,6 +84,7 @@ async def _upload_video_async(session_id: str, file_path: str, mime_type: str):
 
     from services.session import get_session
 
+    current_session_id.set(session_id)
     session = get_session(session_id)
     if not session:
         logger.error(f"Session not found: {session_id}")
@@ -81,9 +104,19 @@ async def _upload_video_async(session_id: str, file_path: str, mime_type: str):
             session.processing_logs.append(log_entry)
             logger.info(f"[Frontend Log] {msg}")
 
-        logger.info("Uploading full video to Gemini...")
-        session.gemini_file = await upload_video_to_gemini(file_path, mime_type, log_callback=log_callback)
-        logger.info(f"Full video uploaded. Gemini file name: {session.gemini_file.name}")
+        if use_segmented_analysis(session.media_info):
+            # 長い動画は区間ごとに解析するため、全編はアップロードしない
+            logger.info("Uploading video segments to Gemini...")
+            session.gemini_segments = await upload_video_segments(
+                file_path, session.media_info, log_callback=log_callback
+            )
+            logger.info(f"Video segments uploaded: {len(session.gemini_segments)}")
+        else:
+            logger.info("Uploading full video to Gemini...")
+            session.gemini_file = await upload_video_to_gemini(
+                file_path, mime_type, log_callback=log_callback, media_info=session.media_info
+            )
+            logger.info(f"Full video uploaded. Gemini file name: {session.gemini_file.name}")
 
         session.upload_status = "completed"
         session.update()
@@ -95,6 +128,27 @@ async def _upload_video_async(session_id: str, file_path: str, mime_type: str):
         session.update()
 
 
+async def _transcribe_full_async(session_id: str, file_path: str):
+    """動画全編を文字起こししてセッションに保存"""
+    import logging
+    logger = logging.getLogger(__name__)
+
+    from services.session import get_session
+
+    current_session_id.set(session_id)
+    session = get_session(session_id)
+    if not session:
+        return
+
+    try:
+        segments = await transcribe_full_video(file_path, media_info=session.media_info)
+        session.full_transcript = format_transcript(segments)
+        session.update()
+    except Exception as e:
+        # 全編文字起こしは補助情報のため、失敗しても処理は続行する
+        logger.error(f"Full transcription error: {e}", exc_info=True)
+
+
 async def _process_video_async(session_id: str, file_path: str, mime_type: str):
     """動画処理の非同期実装"""
     import logging
@@ -102,6 +156,7 @@ async def _process_video_async(session_id: str, file_path: str, mime_type: str):
 
     from services.session import get_session
 
+    current_session_id.set(session_id)
     session = get_session(session_id)
     if not session:
         logger.error(f"Session not found: {session_id}")
@@ -114,6 +169,22 @@ async def _process_video_async(session_id: str, file_path: str, mime_type: str):
         session.processing_progress = 0
         session.update()
 
+        # メディア情報は1回だけ取得し、以降の各処理で使い回す
+        loop = asyncio.get_event_loop()
+        session.media_info = await loop.run_in_executor(None, probe_media, file_path)
+        logger.info(
+            f"Media info: duration={session.media_info.duration:.1f}s, "
+            f"video={session.media_info.video_codec}, audio={session.media_info.audio_codec}, "
+            f"keyframe_interval={session.media_info.keyframe_interval}"
+        )
+
+        # Geminiへのアップロード（と処理待ち）は時間がかかるため、スコーピングと並行して進める
+        session.upload_status = "uploading"
+        session.upload_task = asyncio.create_task(_upload_video_async(session_id, file_path, mime_type))
+
+        if FULL_TRANSCRIPTION_ENABLED:
+            session.transcript_task = asyncio.create_task(_transcribe_full_async(session_id, file_path))
+
         # 2. 音声ベースのスコーピング実行 (GPT-4o + Gemini)
         session.processing_step = "動画を解析中（冒頭シーンを確認）"
         session.processing_progress = 20
@@ -138,42 +209,32 @@ async def _process_video_async(session_id: str, file_path: str, mime_type: str):
             session.processing_logs.append(log_entry)
             logger.info(f"[Frontend Log] {msg}")
 
-        scoping_result = await analyze_audio_scoping_from_video(file_path, user_context, log_callback=log_callback)
+        # 冒頭の音声とフレームを1回のFFmpeg実行で抽出
+        audio_path, head_frames = await prepare_scoping_assets(
+            file_path, session.media_info, frame_interval=HEAD_FRAME_INTERVAL
+        )
+        session.extracted_frames.extend(head_frames)
+
+        try:
+            scoping_result = await analyze_audio_scoping_from_video(
+                file_path, user_context, log_callback=log_callback,
+                media_info=session.media_info, audio_path=audio_path,
+            )
+        finally:
+            if audio_path and os.path.exists(audio_path):
+                os.unlink(audio_path)
         logger.info(f"Scoping result (first 200 chars): {scoping_result[:200] if scoping_result else '(empty)'}")
 
         session.scoping_result = scoping_result
         session.user_policy = scoping_result  # デフォルトで同じ
 
-        # スコーピング完了後の進捗表示
-
-        session.processing_step = "動画を解析中（業務フローを把握）"
-        session.processing_progress = 60
-        session.update()
-
-        await asyncio.sleep(1)
-        session.processing_step = "動画を解析中（重要ポイントを抽出）"
-        session.processing_progress = 65
-        session.update()
-
-        await asyncio.sleep(1)
-        session.processing_progress = 70
-        session.update()
-
-        # 5. 完了（動画アップロードはバックグラウンドで実行）
+        # 完了（動画アップロードはバックグラウンドで継続）
         session.processing_step = "解析完了"
         session.processing_progress = 100
         session.phase = ProcessingPhase.QUESTIONING
         session.update()
         logger.info("Processing complete, phase set to QUESTIONING")
 
-        # 6. バックグラウンドで動画をアップロード
-        # アップロード状態を事前に設定（タスク開始遅延対策）
-        session.upload_status = "uploading"
-        session.update()
-        logger.info("Starting background video upload...")
-        asyncio.create_task(_upload_video_async(session_id, file_path, mime_type))
-        logger.info("Background video upload task created")
-
     except Exception as e:
         logger.error(f"Processing error: {e}", exc_info=True)
         session.phase = ProcessingPhase.ERROR
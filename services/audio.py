@@ -0,0 +1,229 @@
+"""
+音声前処理サービス
+
+文字起こしの前に無音区間を検出・除去し、除去後の音声の時刻を
+元動画の時刻へ戻すためのオフセット対応表を提供する。
+"""
+import bisect
+import re
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import ffmpeg
+
+logger = logging.getLogger(__name__)
+
+# 無音とみなす音量（dB）
+SILENCE_NOISE_DB = -35
+# この秒数以上続く無音のみを除去対象にする
+SILENCE_MIN_DURATION = 2.0
+# 発話区間の前後に残す余白（秒）。語頭・語尾の切れを防ぐ
+SILENCE_PADDING = 0.3
+# 除去できる無音の合計がこの秒数未満なら、再エンコードせず元の音声を使う
+SILENCE_MIN_GAIN = 5.0
+
+# 文字起こし用音声のエンコード設定（モノラル16kHz・低ビットレートのOpus）
+# bitexact: Oggのストリーム番号を固定し、同じ入力から同じバイト列を得る（結果キャッシュのキー用）
+TRANSCRIPTION_ENCODE_OPTIONS = {
+    "ac": 1,
+    "ar": 16000,
+    "acodec": "libopus",
+    "application": "voip",
+    "b:a": "24k",
+    "fflags": "+bitexact",
+}
+
+_SILENCE_START_PATTERN = re.compile(r"silence_start:\s*(-?[\d.]+)")
+_SILENCE_END_PATTERN = re.compile(r"silence_end:\s*(-?[\d.]+)")
+_DURATION_PATTERN = re.compile(r"Duration:\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+
+@dataclass
+class AudioOffsetMap:
+    """
+    無音除去後の音声と元音声の時刻対応表
+
+    segments は元音声で残した区間 (start, end) の時刻順リスト。
+    除去後の音声ではこれらの区間が隙間なく連結されている。
+    """
+    segments: List[Tuple[float, float]] = field(default_factory=list)
+
+    def __post_init__(self):
+        # 除去後の音声における各区間の開始位置
+        self._starts = []
+        position = 0.0
+        for start, end in self.segments:
+            self._starts.append(position)
+            position += end - start
+        self._total = position
+
+    @property
+    def duration(self) -> float:
+        """除去後の音声の長さ（秒）"""
+        return self._total
+
+    def to_source(self, seconds: float) -> float:
+        """除去後の音声の時刻を元音声の時刻に変換する"""
+        if not self.segments:
+            return seconds
+        index = max(bisect.bisect_right(self._starts, seconds) - 1, 0)
+        start, end = self.segments[index]
+        return min(start + (seconds - self._starts[index]), end)
+
+
+def _parse_duration(log: str) -> Optional[float]:
+    match = _DURATION_PATTERN.search(log)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def detect_silences(
+    audio_path: str,
+    noise_db: float = SILENCE_NOISE_DB,
+    min_duration: float = SILENCE_MIN_DURATION,
+) -> Tuple[List[Tuple[float, float]], float]:
+    """
+    silencedetectフィルタで無音区間を検出する
+
+    Returns:
+        (無音区間 (start, end) のリスト, 音声の長さ（秒）)
+    """
+    _, stderr = (
+        ffmpeg
+        .input(audio_path)
+        .filter("silencedetect", noise=f"{noise_db}dB", d=min_duration)
+        .output("-", format="null")
+        .global_args("-nostats")
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    log = stderr.decode("utf-8", errors="replace")
+    duration = _parse_duration(log) or 0.0
+
+    starts = [max(float(value), 0.0) for value in _SILENCE_START_PATTERN.findall(log)]
+    ends = [float(value) for value in _SILENCE_END_PATTERN.findall(log)]
+    # 末尾まで無音が続く場合は silence_end が出力されない
+    ends += [duration] * (len(starts) - len(ends))
+
+    return list(zip(starts, ends)), duration
+
+
+def speech_segments(
+    silences: List[Tuple[float, float]],
+    duration: float,
+    padding: float = SILENCE_PADDING,
+) -> List[Tuple[float, float]]:
+    """無音区間の補集合（前後に余白を付けた発話区間）を返す"""
+    segments = []
+    position = 0.0
+    for silence_start, silence_end in silences:
+        if silence_start > position:
+            segments.append((max(position - padding, 0.0), min(silence_start + padding, duration)))
+        position = max(position, silence_end)
+    if position < duration:
+        segments.append((max(position - padding, 0.0), duration))
+
+    # 余白で重なった区間を結合
+    merged = []
+    for start, end in segments:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def trim_silence(
+    audio_path: str,
+    output_path: str,
+    noise_db: float = SILENCE_NOISE_DB,
+    min_duration: float = SILENCE_MIN_DURATION,
+    padding: float = SILENCE_PADDING,
+) -> Optional[AudioOffsetMap]:
+    """
+    長い無音区間を除去した音声を output_path に書き出す
+
+    Returns:
+        時刻対応表。除去する価値がない（削減量が小さい）場合は書き出さずNone。
+        発話区間がまったくない場合は segments が空の対応表を返す（書き出しなし）。
+    """
+    silences, duration = detect_silences(audio_path, noise_db, min_duration)
+    segments = speech_segments(silences, duration, padding)
+
+    if not segments:
+        logger.info("No speech detected in audio")
+        return AudioOffsetMap([])
+
+    kept = sum(end - start for start, end in segments)
+    if duration - kept < SILENCE_MIN_GAIN:
+        return None
+
+    expression = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in segments)
+    (
+        ffmpeg
+        .input(audio_path)
+        .filter("aselect", expression)
+        .filter("asetpts", "N/SR/TB")
+        .output(output_path, **TRANSCRIPTION_ENCODE_OPTIONS)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+    logger.info(f"Silence trimmed: {duration:.1f}s -> {kept:.1f}s ({len(segments)} segments)")
+    return AudioOffsetMap(segments)
+
+
+# 全編文字起こしのチャンク分割
+# 1チャンクの最大長（秒）
+CHUNK_MAX_SECONDS = 600
+# 無音で区切る場合でも、これより短いチャンクは作らない（秒）
+CHUNK_MIN_SECONDS = 120
+# 分割点として使う無音の最小長（秒）
+CHUNK_SPLIT_SILENCE = 0.5
+
+
+def plan_chunks(
+    silences: List[Tuple[float, float]],
+    duration: float,
+    max_seconds: float = CHUNK_MAX_SECONDS,
+    min_seconds: float = CHUNK_MIN_SECONDS,
+) -> List[Tuple[float, float]]:
+    """
+    音声を max_seconds 以下のチャンクに分割する区間 (start, end) を返す
+
+    分割点は各チャンクの上限に最も近い無音区間の中央とし、
+    範囲内に無音がなければ上限の位置で分割する。
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    chunks = []
+    chunk_start = 0.0
+
+    while duration - chunk_start > max_seconds:
+        limit = chunk_start + max_seconds
+        lo = bisect.bisect_right(midpoints, chunk_start + min_seconds)
+        hi = bisect.bisect_right(midpoints, limit)
+        split = midpoints[hi - 1] if hi > lo else limit
+        chunks.append((chunk_start, split))
+        chunk_start = split
+
+    if duration > chunk_start:
+        chunks.append((chunk_start, duration))
+    return chunks
+
+
+def is_silent_span(silences: List[Tuple[float, float]], start: float, end: float) -> bool:
+    """区間全体が1つの無音区間に含まれるか"""
+    return any(s_start <= start and end <= s_end for s_start, s_end in silences)
+
+
+def cut_audio_chunk(audio_path: str, output_path: str, start: float, end: float) -> None:
+    """音声の [start, end) 区間を再エンコードなしで切り出す"""
+    (
+        ffmpeg
+        .input(audio_path, ss=start, t=end - start)
+        .output(output_path, acodec="copy")
+        .overwrite_output()
+        .run(quiet=True)
+    )
@@ -0,0 +1,97 @@
+"""
+フレーム画像ストアサービス
+
+抽出したフレーム(JPEG)をSHA-256のコンテンツアドレスでディスクに保存し、
+ドキュメントからは /frames/{hash}.jpg のURLで参照する。
+"""
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+# 保存先ディレクトリ
+FRAME_STORE_DIR = Path(tempfile.gettempdir()) / "hikitsugi_frames"
+FRAME_STORE_DIR.mkdir(exist_ok=True)
+
+# 配信URLのプレフィックス
+FRAME_URL_PREFIX = "/frames"
+
+# フレームの保持期間（セッションと同じ24時間）
+FRAME_TTL = 24 * 60 * 60
+
+_DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+_FRAME_URL_PATTERN = re.compile(re.escape(FRAME_URL_PREFIX) + r"/([0-9a-f]{64})\.jpg")
+
+
+def _frame_path(digest: str) -> Path:
+    return FRAME_STORE_DIR / f"{digest}.jpg"
+
+
+def store_frame(jpeg: bytes) -> str:
+    """フレームを保存してハッシュ値を返す（同一内容は1回だけ書き込む）"""
+    digest = hashlib.sha256(jpeg).hexdigest()
+    path = _frame_path(digest)
+
+    if path.exists():
+        # 参照されたフレームは保持期間を延長
+        os.utime(path)
+        return digest
+
+    # 書き込み途中のファイルを配信しないよう、一時ファイル経由で置き換える
+    fd, temp_path = tempfile.mkstemp(dir=FRAME_STORE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(jpeg)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    return digest
+
+
+def get_frame_path(digest: str) -> Optional[Path]:
+    """ハッシュ値からフレームのパスを取得（存在しなければNone）"""
+    if not _DIGEST_PATTERN.match(digest):
+        return None
+    path = _frame_path(digest)
+    if not path.exists():
+        return None
+    return path
+
+
+def frame_url(jpeg: bytes) -> str:
+    """フレームを保存して配信URLを返す"""
+    return f"{FRAME_URL_PREFIX}/{store_frame(jpeg)}.jpg"
+
+
+def inline_frame_urls(markdown_text: str) -> str:
+    """Markdown内のフレームURLをBase64のdata URIに置き換える（エクスポート用）"""
+
+    def replacer(match):
+        path = get_frame_path(match.group(1))
+        if path is None:
+            return match.group(0)
+        b64_data = base64.b64encode(path.read_bytes()).decode("utf-8")
+        return f"data:image/jpeg;base64,{b64_data}"
+
+    return _FRAME_URL_PATTERN.sub(replacer, markdown_text)
+
+
+def cleanup_old_frames() -> int:
+    """保持期間を過ぎたフレームを削除"""
+    now = time.time()
+    removed = 0
+    for path in FRAME_STORE_DIR.glob("*.jpg"):
+        try:
+            if now - path.stat().st_mtime > FRAME_TTL:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
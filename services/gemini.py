@@ -3,18 +3,66 @@ Gemini API連携サービス
 """
 import os
 import re
+import math
 import time
 import asyncio
 import logging
-from typing import AsyncGenerator, Optional
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import google.generativeai as genai
 import ffmpeg
 import tempfile
-from openai import AsyncOpenAI
 from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 
+from frame_extractor import (
+    FrameSet,
+    MediaInfo,
+    PROXY_CRF,
+    PROXY_FPS,
+    PROXY_MAX_WIDTH,
+    encode_proxy_video,
+    extract_head_assets,
+    format_timestamp,
+    get_video_duration,
+    parse_timestamp_str,
+    shift_timestamps,
+)
+from services.audio import (
+    AudioOffsetMap,
+    TRANSCRIPTION_ENCODE_OPTIONS,
+    cut_audio_chunk,
+    detect_silences,
+    is_silent_span,
+    plan_chunks,
+    trim_silence,
+    CHUNK_SPLIT_SILENCE,
+)
+from services.transcription import (
+    TranscriptSegment,
+    TranscriptionProvider,
+    TranscriptionResult,
+    get_transcription_provider,
+)
+from services import rate_limit
+from services.gemini_files import (
+    FileStatePoller,
+    forget_uploaded_file,
+    lookup_uploaded_file,
+    register_uploaded_file,
+)
+from services.resilience import call_with_resilience
+from services.result_cache import (
+    SCOPING_NAMESPACE,
+    TRANSCRIPT_NAMESPACE,
+    file_sha256,
+    result_cache,
+    text_sha256,
+)
+
 load_dotenv()
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
@@ -22,8 +70,18 @@ genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 logger = logging.getLogger(__name__)
 
 # モデル設定
-model = genai.GenerativeModel('gemini-2.5-flash-lite')
-openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-lite'
+model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+# File APIには非同期版がないため、専用のスレッドプールで実行する
+# （既定のプールを占有して他の処理を止めないよう、同時実行数を分ける）
+GEMINI_FILE_API_WORKERS = int(os.getenv("GEMINI_FILE_API_WORKERS", "4"))
+_file_api_executor = ThreadPoolExecutor(
+    max_workers=GEMINI_FILE_API_WORKERS, thread_name_prefix="gemini-file-api"
+)
+
+# 動画の内容ハッシュ（最大2GBの読み込み）も既定のプールを占有しないよう専用スレッドで計算する
+_hash_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="content-hash")
 
 # システムプロンプト
 SYSTEM_PROMPT = """あなたは業務引継ぎ専門の支援AIです。
@@ -164,142 +222,642 @@ CONVERSATIONAL_QUESTIONS = [
 ]
 
 
-def parse_retry_delay(error_message: str) -> int:
-    """エラーメッセージからリトライ待機時間を抽出"""
-    match = re.search(r'retry in (\d+(?:\.\d+)?)', str(error_message), re.IGNORECASE)
-    if match:
-        return int(float(match.group(1))) + 1
-    return 30
+# TPM制限用のトークン数の見積もり
+# 日本語は1文字あたり1トークン弱のため、文字数をそのまま使う（多めの見積もり）
+# 動画はGeminiの既定解像度で1秒あたり約300トークン
+VIDEO_TOKENS_PER_SECOND = 300
+# 長さが分からないファイルの見積もり
+FILE_TOKENS_FALLBACK = 100_000
+
 
+def _estimate_tokens(contents) -> int:
+    """リクエストの入力トークン数を見積もる"""
+    if isinstance(contents, str):
+        return len(contents)
+    if isinstance(contents, (list, tuple)):
+        return sum(_estimate_tokens(item) for item in contents)
 
-async def generate_with_retry(contents, stream: bool = False, max_retries: int = 3):
+    video_metadata = getattr(contents, "video_metadata", None)
+    duration = getattr(video_metadata, "video_duration", None)
+    if hasattr(duration, "total_seconds"):
+        return int(duration.total_seconds() * VIDEO_TOKENS_PER_SECOND)
+    return FILE_TOKENS_FALLBACK
+
+
+async def generate_with_retry(contents, stream: bool = False):
     """リトライ機能付きのAPI呼び出し（非同期）"""
-    for attempt in range(max_retries):
-        try:
-            # 同期APIを非同期で実行
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: model.generate_content(contents, stream=stream)
-            )
-            return response
-        except google_exceptions.ResourceExhausted as e:
-            wait_time = parse_retry_delay(str(e))
-            if attempt < max_retries - 1:
-                await asyncio.sleep(wait_time)
-            else:
-                raise e
-        except Exception as e:
-            raise e
-
-
-async def upload_video_to_gemini(file_path: str, mime_type: str, log_callback=None) -> object:
-    """動画をGemini File APIにアップロード"""
-    logger.info(f"Uploading to Gemini: {file_path} (type: {mime_type})")
+    tokens = _estimate_tokens(contents)
+
+    async def call():
+        # 上限に達しそうな場合は送信前に待つ
+        await rate_limit.acquire(GEMINI_MODEL_NAME, tokens)
+        # stream=True の場合は async for で読み出すレスポンスを返す
+        return await model.generate_content_async(contents, stream=stream)
+
+    return await call_with_resilience("gemini", call)
+
 
+async def _call_file_api(func):
+    """File APIの同期呼び出しを専用スレッドプールで実行（レート制限・再試行付き）"""
     loop = asyncio.get_event_loop()
 
+    async def call():
+        await rate_limit.acquire("gemini-file-api")
+        return await loop.run_in_executor(_file_api_executor, func)
+
+    return await call_with_resilience("gemini-file-api", call)
+
+
+# 処理状態をまとめて問い合わせる場合に list_files を使うファイル数
+# （少ないうちは get_file を個別に呼ぶ方が軽い）
+FILE_POLL_BATCH_MIN = 3
+# list_files で読む件数の上限（新しい順に返るため、処理中のファイルは先頭付近にある）
+# 見つからなかったファイルは get_file で個別に確認する
+FILE_POLL_LIST_LIMIT = 100
+# 処理待ちの経過をユーザーに表示する間隔（秒）
+FILE_PROGRESS_LOG_INTERVAL = 10
+
+
+def _list_pending_files(names: List[str]) -> Dict[str, object]:
+    """list_files から names のファイルを探す（全件見つかるか上限に達したら打ち切る）"""
+    pending = set(names)
+    found = {}
+    for index, f in enumerate(genai.list_files(page_size=FILE_POLL_LIST_LIMIT)):
+        if f.name in pending:
+            found[f.name] = f
+            if len(found) == len(pending):
+                break
+        if index + 1 >= FILE_POLL_LIST_LIMIT:
+            break
+    return found
+
+
+async def _fetch_file_states(names: List[str]) -> Dict[str, object]:
+    """ファイルの現在の状態を取得（取得に失敗したファイルは例外を値にする）"""
+    states = {}
+    if len(names) >= FILE_POLL_BATCH_MIN:
+        states = await _call_file_api(lambda: _list_pending_files(names))
+        names = [name for name in names if name not in states]
+
+    results = await asyncio.gather(
+        *(_call_file_api(lambda name=name: genai.get_file(name)) for name in names),
+        return_exceptions=True,
+    )
+    states.update(zip(names, results))
+    return states
+
+
+_file_poller = FileStatePoller(_fetch_file_states)
+
+
+async def _upload_and_wait(file_path: str, mime_type: str, log_callback=None) -> object:
+    """動画をアップロードし、処理が完了するまで待つ"""
     # アップロード
     if log_callback:
         log_callback("[Gemini File API] 動画のアップロードを開始しています...")
 
-    file = await loop.run_in_executor(
-        None,
-        lambda: genai.upload_file(file_path, mime_type=mime_type)
-    )
+    file = await _call_file_api(lambda: genai.upload_file(file_path, mime_type=mime_type))
     logger.info(f"Upload started. File name: {file.name}, state: {file.state.name}")
 
     if log_callback:
         log_callback(f"[Gemini File API] アップロード完了。処理待機中...")
 
-    # 処理完了を待機
-    wait_count = 0
-    while file.state.name == "PROCESSING":
-        wait_count += 1
-        elapsed = wait_count * 2
-        logger.info(f"Waiting for processing... ({elapsed}s)")
+    # 処理完了を待機（全セッション共通のポーラーで確認）
+    waiter = asyncio.ensure_future(_file_poller.wait_until_active(file, os.path.getsize(file_path)))
+    wait_start = time.time()
+    try:
+        while not waiter.done():
+            await asyncio.wait({waiter}, timeout=FILE_PROGRESS_LOG_INTERVAL)
+            # 10秒ごとにログを出力（ユーザーへのフィードバック）
+            if not waiter.done() and log_callback:
+                log_callback(f"[Gemini File API] 動画を処理中です... ({time.time() - wait_start:.0f}秒経過)")
+        file = waiter.result()
+    finally:
+        waiter.cancel()
 
-        # 10秒ごとにログを出力（ユーザーへのフィードバック）
-        if wait_count % 5 == 0 and log_callback:
-            log_callback(f"[Gemini File API] 動画を処理中です... ({elapsed}秒経過)")
+    logger.info(f"Final state: {file.state.name}")
 
-        await asyncio.sleep(2)
-        file = await loop.run_in_executor(
-            None,
-            lambda: genai.get_file(file.name)
+    if log_callback:
+        log_callback(f"[Gemini File API] 動画の処理が完了しました")
+
+    return file
+
+
+# アップロード前に解析用の軽量なプロキシ動画（縮小・低fps、音声はそのまま）へ変換するか
+PROXY_UPLOAD_ENABLED = os.getenv("PROXY_UPLOAD_ENABLED", "").lower() in ("1", "true", "yes")
+# これより小さい動画は変換せずにそのままアップロードする
+PROXY_MIN_BYTES = 50 * 1024 * 1024
+# 変換の同時実行数（FFmpeg自体が複数コアを使うため少なめにする）
+PROXY_ENCODE_WORKERS = int(os.getenv("PROXY_ENCODE_WORKERS", "2"))
+_proxy_executor = ThreadPoolExecutor(max_workers=PROXY_ENCODE_WORKERS, thread_name_prefix="proxy-encode")
+# アップロード済みファイルの再利用キーに含める変換設定
+PROXY_VARIANT = f"proxy-{PROXY_MAX_WIDTH}w-{PROXY_FPS}fps-crf{PROXY_CRF}"
+
+# 同じ内容の動画のアップロード中タスク（同時に来た別セッションはこれを待つ）
+_pending_uploads: Dict[str, asyncio.Task] = {}
+
+
+def _use_proxy(file_path: str, media_info: Optional[MediaInfo]) -> bool:
+    """プロキシ動画に変換してからアップロードするか"""
+    if not PROXY_UPLOAD_ENABLED:
+        return False
+    if media_info is not None and not media_info.has_video:
+        return False
+    return os.path.getsize(file_path) >= PROXY_MIN_BYTES
+
+
+async def _upload_proxy_and_wait(
+    file_path: str,
+    mime_type: str,
+    log_callback=None,
+    media_info: Optional[MediaInfo] = None,
+) -> object:
+    """プロキシ動画に変換してアップロードする（変換に失敗した場合は元の動画をアップロード）"""
+    loop = asyncio.get_event_loop()
+    proxy_path = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
+
+    try:
+        if log_callback:
+            log_callback("[FFmpeg] 解析用の軽量な動画に変換しています...")
+        start = time.time()
+        try:
+            await loop.run_in_executor(
+                _proxy_executor,
+                lambda: encode_proxy_video(file_path, proxy_path, media_info=media_info)
+            )
+        except RuntimeError as e:
+            logger.warning(f"Proxy encode failed, uploading original: {e}")
+            return await _upload_and_wait(file_path, mime_type, log_callback)
+
+        original_size = os.path.getsize(file_path)
+        proxy_size = os.path.getsize(proxy_path)
+        logger.info(
+            f"Proxy encoded in {time.time() - start:.1f}s: "
+            f"{original_size / 1024 / 1024:.1f}MB -> {proxy_size / 1024 / 1024:.1f}MB"
         )
+        if log_callback:
+            log_callback(f"[FFmpeg] 変換完了（{original_size / 1024 / 1024:.0f}MB → {proxy_size / 1024 / 1024:.0f}MB）")
 
-    logger.info(f"Final state: {file.state.name}")
+        return await _upload_and_wait(proxy_path, "video/mp4", log_callback)
 
-    if file.state.name != "ACTIVE":
-        raise RuntimeError(f"動画処理失敗: {file.state.name}")
+    finally:
+        if os.path.exists(proxy_path):
+            os.unlink(proxy_path)
 
-    if log_callback:
-        log_callback(f"[Gemini File API] 動画の処理が完了しました")
 
+async def _reuse_uploaded_file(content_key: str) -> Optional[object]:
+    """登録済みのリモートファイルがまだ使えれば取得する"""
+    name = await lookup_uploaded_file(content_key)
+    if name is None:
+        return None
+
+    try:
+        file = await _call_file_api(lambda: genai.get_file(name))
+    except (google_exceptions.NotFound, google_exceptions.PermissionDenied):
+        file = None
+    except Exception as e:
+        # 一時的な障害（再試行後の503・遮断中など）でも、通常のアップロードで続行できるようにする
+        logger.warning(f"Failed to look up registered Gemini file {name}: {e}")
+        file = None
+
+    if file is None or file.state.name != "ACTIVE":
+        logger.info(f"Registered Gemini file is no longer available: {name}")
+        await forget_uploaded_file(content_key)
+        return None
     return file
 
 
-async def _extract_audio_for_transcription(video_path: str, duration: Optional[int] = None) -> str:
-    """文字起こし用に動画から音声を抽出（mp3形式）"""
-    output_path = tempfile.NamedTemporaryFile(suffix='.mp3', delete=False).name
+async def upload_video_to_gemini(
+    file_path: str,
+    mime_type: str,
+    log_callback=None,
+    media_info: Optional[MediaInfo] = None,
+) -> object:
+    """
+    動画をGemini File APIにアップロード
+
+    同じ内容の動画がアップロード済み（有効期限内）ならそのファイルを使い回し、
+    アップロード中であればその完了を待つ。
+    PROXY_UPLOAD_ENABLED の場合は、大きな動画をプロキシ動画に変換してからアップロードする。
+    """
+    logger.info(f"Uploading to Gemini: {file_path} (type: {mime_type})")
+    if media_info:
+        logger.info(
+            f"Media: {media_info.duration:.1f}s, {media_info.size} bytes, "
+            f"video={media_info.video_codec}, audio={media_info.audio_codec}"
+        )
+
     loop = asyncio.get_event_loop()
+    content_key = await loop.run_in_executor(_hash_executor, file_sha256, file_path)
+    use_proxy = _use_proxy(file_path, media_info)
+    if use_proxy:
+        # 元の動画とプロキシ動画は別のリモートファイルとして管理する
+        content_key = f"{content_key}:{PROXY_VARIANT}"
+
+    if use_proxy:
+        upload = functools.partial(_upload_proxy_and_wait, file_path, mime_type, log_callback, media_info)
+    else:
+        upload = functools.partial(_upload_and_wait, file_path, mime_type, log_callback)
+    return await _upload_once(content_key, upload, log_callback)
+
+
+async def _upload_once(
+    content_key: str,
+    upload: Callable[[], Awaitable[object]],
+    log_callback=None,
+) -> object:
+    """
+    content_key のファイルがアップロード済みなら使い回し、アップロード中ならその完了を待つ
+
+    どちらでもなければ upload() を実行して登録する（変換などの前処理も upload() の中で行い、
+    使い回せる場合は前処理ごと省く）。
+    """
+    file = await _reuse_uploaded_file(content_key)
+    if file is not None:
+        logger.info(f"Reusing uploaded Gemini file: {file.name}")
+        if log_callback:
+            log_callback("[Gemini File API] アップロード済みの同じ動画を使用します")
+        return file
+
+    task = _pending_uploads.get(content_key)
+    if task is None:
+        task = asyncio.create_task(upload())
+        _pending_uploads[content_key] = task
+        task.add_done_callback(lambda _: _pending_uploads.pop(content_key, None))
+    elif log_callback:
+        log_callback("[Gemini File API] 同じ動画のアップロード完了を待っています...")
+
+    # 待っている側がキャンセルされても、共有のアップロードは続ける
+    file = await asyncio.shield(task)
+    await register_uploaded_file(content_key, file)
+    return file
+
+
+# 文字起こしAPIがそのまま受け付ける音声コーデック → 格納するコンテナの拡張子
+TRANSCRIPTION_COPY_FORMATS = {
+    "aac": ".m4a",
+    "mp3": ".mp3",
+    "opus": ".ogg",
+    "vorbis": ".ogg",
+    "flac": ".flac",
+}
+
+# スコーピングで文字起こしする冒頭の秒数（5分）
+SCOPING_AUDIO_SECONDS = 300
+
+# 文字起こしAPIのアップロード上限（余裕を持たせた値）
+TRANSCRIPTION_MAX_BYTES = 24 * 1024 * 1024
 
-    def _run_ffmpeg():
-        stream = ffmpeg.input(video_path)
-        if duration:
-            stream = ffmpeg.input(video_path, t=duration)
-            
+
+def _can_copy_audio(media_info: Optional[MediaInfo], duration: Optional[int]) -> bool:
+    """音声トラックを再エンコードせずに文字起こしへ渡せるか"""
+    if not media_info or media_info.audio_codec not in TRANSCRIPTION_COPY_FORMATS:
+        return False
+
+    # ビットレートが高くアップロード上限を超えそうな場合は圧縮する
+    bit_rate = media_info.audio_bit_rate or media_info.bit_rate
+    seconds = min(duration or media_info.duration, media_info.duration)
+    if bit_rate and bit_rate / 8 * seconds > TRANSCRIPTION_MAX_BYTES:
+        return False
+    return True
+
+
+def _transcription_audio_output(
+    media_info: Optional[MediaInfo],
+    duration: Optional[int],
+) -> Tuple[str, dict]:
+    """文字起こし用音声の出力形式（拡張子, FFmpegオプション）を決める"""
+    if _can_copy_audio(media_info, duration):
+        return TRANSCRIPTION_COPY_FORMATS[media_info.audio_codec], {"acodec": "copy"}
+    return ".ogg", TRANSCRIPTION_ENCODE_OPTIONS
+
+
+async def _extract_audio_for_transcription(
+    video_path: str,
+    duration: Optional[int] = None,
+    media_info: Optional[MediaInfo] = None,
+) -> str:
+    """
+    文字起こし用に動画から音声を抽出
+
+    音声トラックのコーデックが文字起こしAPIで受け付けられる場合はストリームコピーし、
+    それ以外はモノラル・低ビットレートのOpusに高速エンコードする。
+    """
+    if media_info and not media_info.has_audio:
+        raise RuntimeError("音声トラックがありません")
+
+    input_kwargs = {"t": duration} if duration else {}
+    loop = asyncio.get_event_loop()
+
+    def _run_ffmpeg(output_path: str, output_kwargs: dict):
         (
-            stream
-            .output(output_path, ac=1, ar=16000, acodec='libmp3lame', q=2)
+            ffmpeg
+            .input(video_path, **input_kwargs)
+            .output(output_path, map="0:a:0", vn=None, **output_kwargs)
             .overwrite_output()
             .run(quiet=True)
         )
 
-    await loop.run_in_executor(None, _run_ffmpeg)
-    return output_path
+    suffix, output_kwargs = _transcription_audio_output(media_info, duration)
+    output_path = tempfile.NamedTemporaryFile(suffix=suffix, delete=False).name
 
+    if output_kwargs.get("acodec") == "copy":
+        try:
+            await loop.run_in_executor(None, lambda: _run_ffmpeg(output_path, output_kwargs))
+            logger.info(f"Audio stream copied ({media_info.audio_codec} -> {suffix})")
+            return output_path
+        except ffmpeg.Error as e:
+            logger.warning(f"Audio stream copy failed, falling back to encode: {e}")
+            os.unlink(output_path)
+            output_path = tempfile.NamedTemporaryFile(suffix=".ogg", delete=False).name
+
+    await loop.run_in_executor(None, lambda: _run_ffmpeg(output_path, TRANSCRIPTION_ENCODE_OPTIONS))
+    return output_path
 
 
-async def analyze_audio_scoping_from_video(video_path: str, user_context: str = "", log_callback=None) -> str:
+async def prepare_scoping_assets(
+    video_path: str,
+    media_info: MediaInfo,
+    frame_interval: Optional[float] = None,
+    clip_path: Optional[str] = None,
+) -> Tuple[Optional[str], FrameSet]:
     """
-    動画から音声を抽出し、gpt-4o-transcribeで文字起こしを行った上で
-    テキストベースのスコーピング解析を行う（高速版）
+    スコーピング用の冒頭音声と、冒頭部分のフレーム/クリップを1回のFFmpeg実行で用意する
+
+    Returns:
+        (音声ファイルのパス（音声トラックがなければNone）, 冒頭部分のフレーム列)
+        音声ファイルの削除は呼び出し側で行う。
     """
-    logger.info(f"Starting audio-only scoping analysis for: {video_path}")
     audio_path = None
-    
+    audio_kwargs = None
+    if media_info.has_audio:
+        suffix, audio_kwargs = _transcription_audio_output(media_info, SCOPING_AUDIO_SECONDS)
+        audio_path = tempfile.NamedTemporaryFile(suffix=suffix, delete=False).name
+
+    loop = asyncio.get_event_loop()
+    start = time.time()
+    try:
+        frames = await loop.run_in_executor(
+            None,
+            lambda: extract_head_assets(
+                video_path,
+                duration=SCOPING_AUDIO_SECONDS,
+                audio_path=audio_path,
+                audio_kwargs=audio_kwargs,
+                clip_path=clip_path,
+                frame_interval=frame_interval,
+                media_info=media_info,
+            )
+        )
+    except ffmpeg.Error as e:
+        # 一括出力に失敗した場合は音声のみ個別に抽出する
+        logger.warning(f"Fused head extraction failed, extracting audio separately: {e}")
+        if audio_path and os.path.exists(audio_path):
+            os.unlink(audio_path)
+        audio_path = None
+        if media_info.has_audio:
+            audio_path = await _extract_audio_for_transcription(
+                video_path, duration=SCOPING_AUDIO_SECONDS, media_info=media_info
+            )
+        frames = FrameSet()
+
+    logger.info(f"Head assets prepared in {time.time() - start:.1f}s ({len(frames)} frames)")
+    return audio_path, frames
+
+
+async def _trim_silence_for_transcription(audio_path: str) -> Tuple[str, Optional[AudioOffsetMap]]:
+    """
+    文字起こし前に長い無音区間を除去する
+
+    Returns:
+        (送信する音声のパス, 時刻対応表)
+        除去しなかった場合は (audio_path, None)。除去後の一時ファイルは呼び出し側で削除する。
+    """
+    trimmed_path = tempfile.NamedTemporaryFile(suffix=".ogg", delete=False).name
+    loop = asyncio.get_event_loop()
+
+    try:
+        offset_map = await loop.run_in_executor(None, lambda: trim_silence(audio_path, trimmed_path))
+    except ffmpeg.Error as e:
+        logger.warning(f"Silence trimming failed, using original audio: {e}")
+        offset_map = None
+
+    if offset_map is None or not offset_map.segments:
+        os.unlink(trimmed_path)
+        return audio_path, offset_map
+    return trimmed_path, offset_map
+
+
+async def _lookup_transcript(
+    audio_path: str, provider: TranscriptionProvider
+) -> Tuple[str, Optional[TranscriptionResult]]:
+    """
+    音声の内容ハッシュとモデル名で文字起こしキャッシュを引く
+
+    Returns:
+        (キャッシュキー, 保存済みの結果。なければNone)
+    """
+    loop = asyncio.get_event_loop()
+    audio_hash = await loop.run_in_executor(None, file_sha256, audio_path)
+    key = f"{audio_hash}:{provider.model}"
+    cached = await result_cache.aget(TRANSCRIPT_NAMESPACE, key)
+    return key, TranscriptionResult.from_json(cached) if cached else None
+
+
+async def _transcribe_head(
+    video_path: str,
+    log_callback=None,
+    media_info: Optional[MediaInfo] = None,
+    audio_path: Optional[str] = None,
+) -> str:
+    """
+    冒頭5分の音声を設定された文字起こしバックエンドで文字起こしする
+
+    audio_path が渡された場合は抽出済みの音声を使う（削除は呼び出し側で行う）。
+    """
+    owns_audio = audio_path is None
+    send_path = None
+
     try:
         # 1. 音声抽出 (冒頭5分のみ)
-        start = time.time()
-        audio_path = await _extract_audio_for_transcription(video_path, duration=300)
-        logger.info(f"Audio extraction completed in {time.time() - start:.1f}s")
-        
-        # 2. 文字起こし (gpt-4o-transcribe)
+        if owns_audio:
+            start = time.time()
+            audio_path = await _extract_audio_for_transcription(
+                video_path, duration=SCOPING_AUDIO_SECONDS, media_info=media_info
+            )
+            logger.info(f"Audio extraction completed in {time.time() - start:.1f}s")
+
+        provider = get_transcription_provider()
+        cache_key, cached = await _lookup_transcript(audio_path, provider)
+        if cached is not None:
+            logger.info(f"[{provider.name}] Transcript cache hit. Length: {len(cached.text)} chars")
+            if log_callback:
+                log_callback(f"[{cached.model}] 保存済みの文字起こし結果を使用しました")
+            return cached.text
+
+        # 無音区間を除去（ハルシネーション対策・送信量削減）
+        send_path, offset_map = await _trim_silence_for_transcription(audio_path)
+        if offset_map is not None and not offset_map.segments:
+            logger.info("No speech in audio. Skipping transcription.")
+            if log_callback:
+                log_callback("音声に発話が含まれていないため文字起こしをスキップしました")
+            return ""
+        if offset_map is not None and log_callback:
+            log_callback(f"無音区間を除去しました（送信する音声: {offset_map.duration:.0f}秒）")
+
+        # 2. 文字起こし
         transcribe_start = time.time()
-        transcription_model = "gpt-4o-transcribe"
-        logger.info(f"[{transcription_model}] Starting transcription...")
+        logger.info(f"[{provider.name}] Starting transcription...")
         if log_callback:
-            log_callback(f"[{transcription_model}] 音声文字起こしを開始しました...")
-        
-        with open(audio_path, "rb") as f:
-            transcript_response = await openai_client.audio.transcriptions.create(
-                model=transcription_model,
-                file=f,
-                response_format="json",
-                language="ja"
-            )
-        transcript = transcript_response.text
+            log_callback(f"[{provider.name}] 音声文字起こしを開始しました...")
+
+        result = await provider.transcribe(send_path)
+        if offset_map is not None:
+            # キャッシュは除去前の音声のハッシュで引くため、時刻も除去前の音声に合わせて保存する
+            result = result.map_times(offset_map.to_source)
+        await result_cache.aset(TRANSCRIPT_NAMESPACE, cache_key, result.to_json())
+        transcript = result.text
         transcribe_duration = time.time() - transcribe_start
-        logger.info(f"[{transcription_model}] Transcription completed in {transcribe_duration:.2f}s. Length: {len(transcript)} chars")
+        logger.info(f"[{result.provider}:{result.model}] Transcription completed in {transcribe_duration:.2f}s. Length: {len(transcript)} chars")
         if log_callback:
-            log_callback(f"[{transcription_model}] 文字起こし完了 ({transcribe_duration:.1f}秒, {len(transcript)}文字)")
-        
+            log_callback(f"[{result.model}] 文字起こし完了 ({transcribe_duration:.1f}秒, {len(transcript)}文字)")
+        return transcript
+
+    finally:
+        # 一時ファイルの削除
+        if send_path and send_path != audio_path and os.path.exists(send_path):
+            os.unlink(send_path)
+        if owns_audio and audio_path and os.path.exists(audio_path):
+            os.unlink(audio_path)
+            logger.debug(f"Temporary audio file deleted: {audio_path}")
+
+
+# 全編文字起こしでチャンクを同時に送信する上限
+TRANSCRIPTION_CONCURRENCY = int(os.getenv("TRANSCRIPTION_CONCURRENCY", "4"))
+
+
+def format_transcript(segments: List[TranscriptSegment]) -> str:
+    """文字起こし結果を [MM:SS] 付きのテキストに整形"""
+    return "\n".join(f"[{format_timestamp(seg.start)}] {seg.text}" for seg in segments if seg.text)
+
+
+async def _transcribe_chunk(
+    audio_path: str, offset: float, length: float, provider: TranscriptionProvider
+) -> List[TranscriptSegment]:
+    """チャンク1つを文字起こしし、時刻を元動画の時刻に補正して返す"""
+    cache_key, result = await _lookup_transcript(audio_path, provider)
+    if result is None:
+        result = await provider.transcribe(audio_path)
+        await result_cache.aset(TRANSCRIPT_NAMESPACE, cache_key, result.to_json())
+
+    # 区間ごとの時刻が返るモデルではそれを使い、なければチャンク全体を1区間とする
+    if result.segments:
+        return [
+            TranscriptSegment(offset + seg.start, offset + seg.end, seg.text)
+            for seg in result.segments
+        ]
+    return [TranscriptSegment(offset, offset + length, result.text.strip())]
+
+
+async def transcribe_full_video(
+    video_path: str,
+    media_info: Optional[MediaInfo] = None,
+    log_callback=None,
+    provider: Optional[TranscriptionProvider] = None,
+) -> List[TranscriptSegment]:
+    """
+    動画全編を文字起こしする
+
+    音声を無音の位置で上限長以下のチャンクに分割し、同時実行数を制限して
+    並列に文字起こしした後、チャンクの開始時刻で補正して時刻順に連結する。
+    全体の待ち時間はおおよそチャンク1つ分になる。
+    """
+    if media_info and not media_info.has_audio:
+        return []
+
+    provider = provider or get_transcription_provider()
+    loop = asyncio.get_event_loop()
+    audio_path = await _extract_audio_for_transcription(video_path, media_info=media_info)
+    chunk_paths = []
+
+    try:
+        silences, duration = await loop.run_in_executor(
+            None,
+            lambda: detect_silences(audio_path, min_duration=CHUNK_SPLIT_SILENCE)
+        )
+        chunks = [
+            (start, end) for start, end in plan_chunks(silences, duration)
+            if not is_silent_span(silences, start, end)
+        ]
+        logger.info(f"Full transcription: {duration:.0f}s audio in {len(chunks)} chunks")
+        if log_callback:
+            log_callback(f"[{provider.name}] 全編の文字起こしを開始しました（{len(chunks)}分割）")
+
+        suffix = os.path.splitext(audio_path)[1]
+        semaphore = asyncio.Semaphore(TRANSCRIPTION_CONCURRENCY)
+
+        async def run(start: float, end: float) -> List[TranscriptSegment]:
+            chunk_path = tempfile.NamedTemporaryFile(suffix=suffix, delete=False).name
+            chunk_paths.append(chunk_path)
+            await loop.run_in_executor(None, lambda: cut_audio_chunk(audio_path, chunk_path, start, end))
+            async with semaphore:
+                return await _transcribe_chunk(chunk_path, start, end - start, provider)
+
+        start_time = time.time()
+        results = await asyncio.gather(*(run(start, end) for start, end in chunks))
+        segments = sorted((seg for chunk in results for seg in chunk), key=lambda seg: seg.start)
+
+        logger.info(f"Full transcription completed in {time.time() - start_time:.1f}s ({len(segments)} segments)")
+        if log_callback:
+            log_callback(f"[{provider.name}] 全編の文字起こし完了 ({time.time() - start_time:.1f}秒)")
+        return segments
+
+    finally:
+        for path in [audio_path, *chunk_paths]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+async def analyze_audio_scoping_from_video(
+    video_path: str,
+    user_context: str = "",
+    log_callback=None,
+    media_info: Optional[MediaInfo] = None,
+    audio_path: Optional[str] = None,
+) -> str:
+    """
+    動画から音声を抽出し、文字起こしを行った上で
+    テキストベースのスコーピング解析を行う（高速版）
+
+    media_info で音声トラックがないと分かっている場合は文字起こしを省略する。
+    audio_path に抽出済みの冒頭音声（prepare_scoping_assets）を渡すと再抽出しない。
+    """
+    logger.info(f"Starting audio-only scoping analysis for: {video_path}")
+
+    try:
+        if media_info and not media_info.has_audio:
+            logger.info("No audio track. Skipping transcription.")
+            if log_callback:
+                log_callback("音声トラックがないため文字起こしをスキップしました")
+            transcript = "（音声トラックなし）"
+        else:
+            transcript = await _transcribe_head(
+                video_path, log_callback=log_callback, media_info=media_info, audio_path=audio_path
+            )
+
         # 3. Geminiでスコーピング解析
-        gemini_model_name = "gemini-2.5-flash-lite"  # model.model_name が直接取れないため明示
+        gemini_model_name = GEMINI_MODEL_NAME
         prompt = f"{SCOPING_PROMPT_AUDIO_ONLY}\n\n【ユーザーからの事前情報】\n{user_context}\n\n【音声書き起こし】\n{transcript}"
-        
+
+        # 同じ書き起こし・事前情報（・プロンプト）での解析結果があれば再利用
+        scoping_key = text_sha256(gemini_model_name, prompt)
+        cached = await result_cache.aget(SCOPING_NAMESPACE, scoping_key)
+        if cached is not None:
+            logger.info(f"[{gemini_model_name}] Scoping cache hit. Length: {len(cached)} chars")
+            if log_callback:
+                log_callback(f"[{gemini_model_name}] 保存済みの解析結果を使用しました")
+            return cached
+
         logger.info(f"[{gemini_model_name}] Starting scoping analysis...")
         if log_callback:
             log_callback(f"[{gemini_model_name}] 解析を開始しました...")
@@ -308,6 +866,7 @@ async def analyze_audio_scoping_from_video(video_path: str, user_context: str =
         response = await generate_with_retry(prompt)
         
         scoping_duration = time.time() - scoping_start
+        await result_cache.aset(SCOPING_NAMESPACE, scoping_key, response.text)
         logger.info(f"[{gemini_model_name}] Scoping response received in {scoping_duration:.2f}s. Length: {len(response.text)} chars")
         if log_callback:
             log_callback(f"[{gemini_model_name}] 解析完了 ({scoping_duration:.1f}秒)")
@@ -316,12 +875,6 @@ async def analyze_audio_scoping_from_video(video_path: str, user_context: str =
     except Exception as e:
         logger.error(f"Audio scoping failed: {e}")
         raise e
-        
-    finally:
-        # 一時ファイルの削除
-        if audio_path and os.path.exists(audio_path):
-            os.unlink(audio_path)
-            logger.debug(f"Temporary audio file deleted: {audio_path}")
 
 
 async def analyze_video_scoping(gemini_file: object, user_context: str = "") -> str:
@@ -344,9 +897,8 @@ async def analyze_video_scoping(gemini_file: object, user_context: str = "") ->
     return response.text
 
 
-async def analyze_video_full(gemini_file: object, user_policy: str) -> str:
-    """動画の詳細解析"""
-    prompt = f"""
+def _full_analysis_prompt(user_policy: str) -> str:
+    return f"""
 【ユーザーご指定の解析方針】
 {user_policy}
 
@@ -361,13 +913,226 @@ async def analyze_video_full(gemini_file: object, user_policy: str) -> str:
 
 {CHECKLIST_TEMPLATE}
 """
+
+
+# 長い動画は区間に分けて並列に詳細解析する（出力の打ち切りと待ち時間の増大を防ぐ）
+# この秒数を超える動画を区間解析の対象にする
+SEGMENT_ANALYSIS_MIN_SECONDS = float(os.getenv("SEGMENT_ANALYSIS_MIN_SECONDS", "1200"))
+# 1区間の最大秒数
+SEGMENT_ANALYSIS_SECONDS = float(os.getenv("SEGMENT_ANALYSIS_SECONDS", "600"))
+
+SEGMENT_TIMELINE_HEADING = "## タイムライン"
+SEGMENT_CHECKLIST_HEADING = "## 引継ぎチェックリスト"
+
+SEGMENT_PROMPT = """
+---
+この動画は、1本の業務動画を時間で分割した {index}/{count} 番目の区間（元動画の {start}〜{end}）です。
+- タイムスタンプはこの区間の先頭を [00:00] として、必ず角括弧付きの [MM:SS] 形式で記載してください
+- 出力は「{timeline_heading}」と「{checklist_heading}」の2つの見出しに分けてください
+"""
+
+CHECKLIST_MERGE_PROMPT = """
+以下は、1本の業務動画を時間で分割し、区間ごとに充填した引継ぎチェックリストです。
+全区間の結果を合わせて、1つのチェックリストに統合してください。
+
+- いずれかの区間で確認できた項目はチェックを入れる
+- 各項目の充填度（0-100%）は全区間を通して再評価する
+- 区間のチェックリストにない情報を追加しない
+- [MM:SS] のタイムスタンプは元動画の時刻に補正済みのため、変更しない
+- 出力は「{checklist_heading}」の見出しから始める
+
+{checklists}
+"""
+
+
+def _plan_segments(duration: float, max_seconds: float) -> List[Tuple[float, float]]:
+    """動画を max_seconds 以下の等しい長さの区間に分割する"""
+    count = max(math.ceil(duration / max_seconds), 1)
+    length = math.ceil(duration / count)
+    return [(start, min(start + length, duration)) for start in range(0, math.ceil(duration), length)]
+
+
+def _transcript_for_segment(transcript: str, start: float, end: float) -> str:
+    """
+    全編の書き起こしから区間に重なる行を抜き出し、時刻を区間の先頭基準にする
+
+    各行は次の行の時刻まで続くものとして扱う（区間ごとの時刻を返さないモデルでは
+    1行がチャンク全体＝最長10分になるため、開始時刻だけでは区間に割り当てられない）。
+    区間の開始より前に始まる行は [00:00] とする。
+    """
+    stamped = []
+    for line in transcript.splitlines():
+        match = re.match(r"\[((?:\d{1,2}:)?\d{1,3}:\d{2})\]", line)
+        if match:
+            stamped.append((parse_timestamp_str(match.group(1)), match.end(), line))
+
+    lines = []
+    for index, (line_start, stamp_end, line) in enumerate(stamped):
+        line_end = stamped[index + 1][0] if index + 1 < len(stamped) else math.inf
+        if line_start < end and line_end > start:
+            lines.append(f"[{format_timestamp(max(line_start - start, 0.0))}]{line[stamp_end:]}")
+    return "\n".join(lines)
+
+
+def _split_segment_analysis(text: str) -> Tuple[str, str]:
+    """区間の解析結果を (タイムライン, チェックリスト) に分ける"""
+    timeline, _, checklist = text.partition(SEGMENT_CHECKLIST_HEADING)
+    timeline = timeline.replace(SEGMENT_TIMELINE_HEADING, "", 1).strip()
+    return timeline, checklist.strip()
+
+
+@dataclass
+class UploadedSegment:
+    """区間ごとに切り出してアップロードした動画"""
+    start: float
+    end: float
+    file: object
+
+
+def use_segmented_analysis(media_info: Optional[MediaInfo]) -> bool:
+    """区間ごとの解析（全編ではなく区間ごとのアップロード）の対象か"""
+    return media_info is not None and media_info.duration > SEGMENT_ANALYSIS_MIN_SECONDS
+
+
+async def _encode_and_upload_segment(
+    video_path: str, start: float, end: float, media_info: Optional[MediaInfo]
+) -> object:
+    """1区間を解析用の軽量な動画として切り出してアップロードする"""
+    loop = asyncio.get_event_loop()
+    clip_path = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
+    try:
+        await loop.run_in_executor(
+            _proxy_executor,
+            lambda: encode_proxy_video(
+                video_path, clip_path, media_info=media_info, start=start, duration=end - start
+            )
+        )
+        # 切り出した動画は変換済みのため、upload_video_to_gemini（プロキシ変換あり）を通さない
+        return await _upload_and_wait(clip_path, "video/mp4")
+    finally:
+        if os.path.exists(clip_path):
+            os.unlink(clip_path)
+
+
+async def upload_video_segments(
+    video_path: str,
+    media_info: Optional[MediaInfo] = None,
+    log_callback=None,
+    segment_seconds: float = SEGMENT_ANALYSIS_SECONDS,
+) -> List[UploadedSegment]:
+    """
+    動画を区間に分け、区間ごとに切り出してGeminiにアップロードする
+
+    長い動画では全編のアップロードの代わりに行う（解析は analyze_video_segments）。
+    同じ動画の同じ区間がアップロード済みなら、切り出しの変換ごと省いて使い回す。
+    """
+    duration = media_info.duration if media_info else get_video_duration(video_path)
+    segments = _plan_segments(duration, segment_seconds)
+    logger.info(f"Uploading {duration:.0f}s video in {len(segments)} segments")
+    if log_callback:
+        log_callback(f"[Gemini File API] 長い動画のため{len(segments)}区間に分けてアップロードします...")
+
+    loop = asyncio.get_event_loop()
+    source_key = await loop.run_in_executor(_hash_executor, file_sha256, video_path)
+
+    async def upload(start: float, end: float) -> UploadedSegment:
+        content_key = f"{source_key}:{start:g}-{end:g}:{PROXY_VARIANT}"
+        file = await _upload_once(
+            content_key, lambda: _encode_and_upload_segment(video_path, start, end, media_info)
+        )
+        return UploadedSegment(start, end, file)
+
+    uploaded = await asyncio.gather(*(upload(start, end) for start, end in segments))
+
+    if log_callback:
+        log_callback("[Gemini File API] 全区間のアップロードが完了しました")
+    return list(uploaded)
+
+
+async def _analyze_segment(
+    segment: UploadedSegment,
+    user_policy: str,
+    transcript: str,
+    index: int,
+    count: int,
+) -> str:
+    """アップロード済みの1区間を解析し、時刻を元動画の時刻に補正して返す"""
+    start, end = segment.start, segment.end
+    prompt = _full_analysis_prompt(user_policy) + SEGMENT_PROMPT.format(
+        index=index + 1,
+        count=count,
+        start=format_timestamp(start),
+        end=format_timestamp(end),
+        timeline_heading=SEGMENT_TIMELINE_HEADING,
+        checklist_heading=SEGMENT_CHECKLIST_HEADING,
+    )
+    segment_transcript = _transcript_for_segment(transcript, start, end) if transcript else ""
+    if segment_transcript:
+        prompt += f"\n【参考: 音声書き起こし（この区間, [MM:SS]は区間の先頭からの時刻）】\n{segment_transcript}\n"
+
+    response = await generate_with_retry([segment.file, prompt])
+    logger.info(f"Segment {index + 1}/{count} analyzed ({format_timestamp(start)}-{format_timestamp(end)})")
+    return shift_timestamps(response.text, start)
+
+
+async def analyze_video_segments(
+    segments: List[UploadedSegment],
+    user_policy: str,
+    transcript: str = "",
+) -> str:
+    """
+    区間ごとにアップロードした動画を並列に詳細解析し、1つの解析結果にまとめる
+
+    各区間はレート制限の範囲で同時に解析する。タイムラインは時刻を補正して時刻順に連結し、
+    チェックリストは区間ごとの結果をGeminiで1つに統合する。
+    """
+    logger.info(f"Segmented analysis: {len(segments)} segments")
+
+    results = await asyncio.gather(*(
+        _analyze_segment(segment, user_policy, transcript, index, len(segments))
+        for index, segment in enumerate(segments)
+    ))
+
+    timelines = []
+    checklists = []
+    for segment, text in zip(segments, results):
+        timeline, checklist = _split_segment_analysis(text)
+        timelines.append(timeline)
+        checklists.append(f"### 区間 {format_timestamp(segment.start)}〜{format_timestamp(segment.end)}\n{checklist}")
+
+    merge_prompt = CHECKLIST_MERGE_PROMPT.format(
+        checklist_heading=SEGMENT_CHECKLIST_HEADING,
+        checklists="\n\n".join(checklists),
+    )
+    merged_checklist = (await generate_with_retry(merge_prompt)).text
+
+    return f"{SEGMENT_TIMELINE_HEADING}\n\n" + "\n\n".join(timelines) + f"\n\n{merged_checklist.strip()}\n"
+
+
+async def analyze_video_full(
+    gemini_file: Optional[object],
+    user_policy: str,
+    transcript: str = "",
+    segments: Optional[List[UploadedSegment]] = None,
+) -> str:
+    """
+    動画の詳細解析（全編の文字起こしがあれば音声説明の参照として添える）
+
+    長い動画で区間ごとにアップロードしている場合（segments）は、
+    区間ごとの並列解析（analyze_video_segments）を行う。
+    """
+    if segments:
+        return await analyze_video_segments(segments, user_policy, transcript)
+
+    prompt = _full_analysis_prompt(user_policy)
+    if transcript:
+        prompt += f"\n【参考: 音声書き起こし（全編, [MM:SS]は動画の時刻）】\n{transcript}\n"
     response = await generate_with_retry([gemini_file, prompt])
     return response.text
 
 
-async def generate_document(video_analysis: str, user_policy: str) -> str:
-    """引継ぎドキュメントを生成"""
-    prompt = f"""
+def _document_prompt(video_analysis: str, user_policy: str) -> str:
+    return f"""
 以下の動画分析結果を元に、Notion貼り付け用Markdownドキュメントを作成してください。
 
 ---
@@ -405,16 +1170,22 @@ async def generate_document(video_analysis: str, user_policy: str) -> str:
 
 ---
 """
-    response = await generate_with_retry(prompt)
+
+
+async def generate_document(video_analysis: str, user_policy: str) -> str:
+    """引継ぎドキュメントを生成"""
+    response = await generate_with_retry(_document_prompt(video_analysis, user_policy))
     return response.text
 
 
+async def stream_document(video_analysis: str, user_policy: str) -> AsyncGenerator[str, None]:
+    """引継ぎドキュメントをストリーミングで生成"""
+    async for text in stream_generate(_document_prompt(video_analysis, user_policy)):
+        yield text
+
+
 async def stream_generate(contents) -> AsyncGenerator[str, None]:
     """ストリーミングで生成（SSE用）"""
-    loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(
-        None,
-        lambda: model.generate_content(contents, stream=True)
-    )
-    for chunk in response:
+    response = await generate_with_retry(contents, stream=True)
+    async for chunk in response:
         yield chunk.text
@@ -0,0 +1,193 @@
+"""
+Gemini File APIのアップロード済みファイル管理
+
+動画の内容ハッシュとアップロード済みのリモートファイル名・有効期限の対応を保存し、
+同じ動画を再アップロードせずに使い回せるようにする。
+対応表は結果キャッシュと同じSQLiteファイルの専用テーブルに保存するため、サーバー再起動後も使える。
+
+アップロード直後のファイルの処理状態（PROCESSING → ACTIVE）は、
+全セッション共通の1つのポーラーでまとめて確認する。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from services.result_cache import RESULT_CACHE_PATH, ResultCache
+
+logger = logging.getLogger(__name__)
+
+GEMINI_FILE_NAMESPACE = "gemini_file"
+# 登録件数の上限の目安（1件100バイト程度のため、約1万件）
+GEMINI_FILE_REGISTRY_MAX_BYTES = 1024 * 1024
+
+# 結果キャッシュと同じファイルの別テーブルに保存する。
+# 文字起こし結果の追加で登録が押し出されず、RESULT_CACHE_MAX_BYTES=0 でも使い回しは有効
+_registry = ResultCache(RESULT_CACHE_PATH, GEMINI_FILE_REGISTRY_MAX_BYTES, table="gemini_files")
+
+# 有効期限までの残り時間がこれより短いファイルは使い回さない（解析中の失効を防ぐ）
+GEMINI_FILE_MIN_REMAINING = 60 * 60
+
+
+async def lookup_uploaded_file(content_key: str) -> Optional[str]:
+    """使い回せるリモートファイル名を取得（なければNone）"""
+    cached = await _registry.aget(GEMINI_FILE_NAMESPACE, content_key)
+    if cached is None:
+        return None
+
+    entry = json.loads(cached)
+    if entry["expires_at"] - time.time() < GEMINI_FILE_MIN_REMAINING:
+        await forget_uploaded_file(content_key)
+        return None
+    return entry["name"]
+
+
+async def register_uploaded_file(content_key: str, file: object) -> None:
+    """処理が完了したリモートファイルを登録"""
+    expiration = getattr(file, "expiration_time", None)
+    if expiration is None:
+        return
+    entry = {"name": file.name, "expires_at": expiration.timestamp()}
+    await _registry.aset(GEMINI_FILE_NAMESPACE, content_key, json.dumps(entry))
+
+
+async def forget_uploaded_file(content_key: str) -> None:
+    """失効・削除されたリモートファイルの登録を消す"""
+    await _registry.adelete(GEMINI_FILE_NAMESPACE, content_key)
+
+
+# 処理状態の確認間隔（秒）
+FILE_POLL_MIN_INTERVAL = 1.0
+FILE_POLL_MAX_INTERVAL = 15.0
+# 経過時間に対する確認間隔の割合（長く待っているファイルほど間隔を空ける）
+FILE_POLL_ELAPSED_RATIO = 0.25
+# ファイルサイズに対する最初の確認間隔（100MBごとに1秒）
+FILE_POLL_BYTES_PER_SECOND = 100 * 1024 * 1024
+# 処理完了を待つ最大秒数
+GEMINI_PROCESSING_TIMEOUT = float(os.getenv("GEMINI_PROCESSING_TIMEOUT", "1800"))
+
+# name のリストを受け取り、name → ファイル（または取得時の例外）を返す関数
+FetchStates = Callable[[List[str]], Awaitable[Dict[str, Union[object, Exception]]]]
+
+
+@dataclass
+class _PendingFile:
+    name: str
+    size_bytes: int
+    started_at: float
+    deadline: float
+    future: asyncio.Future
+    next_check: float = field(default=0.0)
+
+    def schedule_next(self, now: float) -> None:
+        elapsed = now - self.started_at
+        interval = max(
+            FILE_POLL_MIN_INTERVAL,
+            elapsed * FILE_POLL_ELAPSED_RATIO,
+            self.size_bytes / FILE_POLL_BYTES_PER_SECOND,
+        )
+        self.next_check = min(now + min(interval, FILE_POLL_MAX_INTERVAL), self.deadline)
+
+
+class FileStatePoller:
+    """
+    処理中のファイルをまとめて監視し、ACTIVE/FAILED になったら待機中の呼び出し元に知らせる
+
+    確認間隔はファイルサイズと経過時間に応じて伸ばし、確認時期が来たファイルは
+    fetch_states で1回にまとめて問い合わせる。
+    """
+
+    def __init__(self, fetch_states: FetchStates):
+        self.fetch_states = fetch_states
+        self._pending: Dict[str, _PendingFile] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def wait_until_active(self, file: object, size_bytes: int = 0, timeout: Optional[float] = None) -> object:
+        """
+        ファイルの処理完了を待ち、ACTIVE になったファイルを返す
+
+        Raises:
+            RuntimeError: 処理に失敗した場合
+            TimeoutError: timeout 秒以内に完了しなかった場合
+        """
+        if file.state.name != "PROCESSING":
+            return _check_state(file)
+
+        entry = self._pending.get(file.name)
+        if entry is None:
+            loop = asyncio.get_event_loop()
+            now = time.monotonic()
+            entry = _PendingFile(
+                name=file.name,
+                size_bytes=size_bytes,
+                started_at=now,
+                deadline=now + (timeout or GEMINI_PROCESSING_TIMEOUT),
+                future=loop.create_future(),
+            )
+            entry.schedule_next(now)
+            self._pending[file.name] = entry
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        # 待機側がキャンセルされても、同じファイルを待つ他の呼び出し元には影響させない
+        return await asyncio.shield(entry.future)
+
+    async def _run(self) -> None:
+        while self._pending:
+            now = time.monotonic()
+            due = [entry for entry in self._pending.values() if entry.next_check <= now]
+
+            if due:
+                try:
+                    states = await self.fetch_states([entry.name for entry in due])
+                except Exception as e:
+                    states = {entry.name: e for entry in due}
+
+                now = time.monotonic()
+                for entry in due:
+                    self._update(entry, states.get(entry.name), now)
+
+            if self._pending:
+                next_check = min(entry.next_check for entry in self._pending.values())
+                await asyncio.sleep(max(next_check - time.monotonic(), 0.1))
+
+    def _update(self, entry: _PendingFile, state: Union[object, Exception, None], now: float) -> None:
+        error = None
+        if state is None:
+            error = RuntimeError(f"動画ファイルが見つかりません: {entry.name}")
+        elif isinstance(state, Exception):
+            error = state
+        elif state.state.name != "PROCESSING":
+            try:
+                self._resolve(entry, result=_check_state(state))
+            except RuntimeError as e:
+                self._resolve(entry, error=e)
+            return
+        elif now >= entry.deadline:
+            error = TimeoutError(f"動画の処理が{entry.deadline - entry.started_at:.0f}秒以内に完了しませんでした")
+
+        if error is not None:
+            self._resolve(entry, error=error)
+            return
+
+        logger.info(f"Waiting for processing: {entry.name} ({now - entry.started_at:.0f}s)")
+        entry.schedule_next(now)
+
+    def _resolve(self, entry: _PendingFile, result: object = None, error: Optional[Exception] = None) -> None:
+        del self._pending[entry.name]
+        if entry.future.done():
+            return
+        if error is not None:
+            entry.future.set_exception(error)
+        else:
+            entry.future.set_result(result)
+
+
+def _check_state(file: object) -> object:
+    if file.state.name != "ACTIVE":
+        raise RuntimeError(f"動画処理失敗: {file.state.name}")
+    return file
@@ -0,0 +1,152 @@
+"""
+API呼び出しのレート制限サービス
+
+モデルごとのRPM（リクエスト数/分）・TPM（トークン数/分）の上限をトークンバケットで管理し、
+上限に達する前に呼び出しを待たせる。待ち行列はセッションごとに分け、
+順番に1件ずつ通すことで、1つのセッションの大量の呼び出しが他を待たせないようにする。
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 呼び出し元のセッションID（公平な待ち行列のキー）
+current_session_id: ContextVar[str] = ContextVar("current_session_id", default="")
+
+
+@dataclass(frozen=True)
+class RateBudget:
+    """1分あたりの上限（0以下は無制限）"""
+    rpm: int
+    tpm: int = 0
+
+
+# 既定の上限（Gemini・Groqは無料枠、OpenAIはTier 1の値）
+DEFAULT_RATE_BUDGETS: Dict[str, RateBudget] = {
+    "gemini-2.5-flash-lite": RateBudget(rpm=15, tpm=250_000),
+    "gemini-file-api": RateBudget(rpm=60),
+    "gpt-4o-transcribe": RateBudget(rpm=500),
+    "whisper-large-v3-turbo": RateBudget(rpm=20),
+    "whisper-large-v3": RateBudget(rpm=20),
+}
+
+
+def _parse_budgets(value: str) -> Dict[str, RateBudget]:
+    """「model=rpm/tpm,model=rpm」形式の設定を解析"""
+    budgets = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, limits = item.split("=", 1)
+        rpm, _, tpm = limits.partition("/")
+        budgets[name.strip()] = RateBudget(int(rpm), int(tpm or 0))
+    return budgets
+
+
+# 環境変数 RATE_LIMITS で上書き（例: gemini-2.5-flash-lite=4000/4000000,gpt-4o-transcribe=500）
+RATE_BUDGETS = {**DEFAULT_RATE_BUDGETS, **_parse_budgets(os.getenv("RATE_LIMITS", ""))}
+
+
+class TokenBucket:
+    """1分で満杯まで回復するトークンバケット"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を消費できるまでの秒数（上限を超える量は上限として扱う）"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        if not self.unlimited:
+            self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """1モデル分のRPM/TPM制限とセッション間の公平な待ち行列"""
+
+    def __init__(self, name: str, budget: RateBudget):
+        self.name = name
+        self.requests = TokenBucket(budget.rpm)
+        self.tokens = TokenBucket(budget.tpm)
+        self._queues: "OrderedDict[str, Deque[Tuple[int, asyncio.Future]]]" = OrderedDict()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """呼び出し1回分（推定トークン数 tokens）の枠が空くまで待つ"""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        session_id = current_session_id.get()
+        self._queues.setdefault(session_id, deque()).append((tokens, future))
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+
+        # キャンセルされた場合は待ち行列側で読み飛ばす
+        await future
+
+    async def _dispatch(self) -> None:
+        while self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            tokens, future = queue[0]
+
+            if not future.cancelled():
+                now = time.monotonic()
+                wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                if wait > 0:
+                    logger.debug(f"[{self.name}] Rate limited. Waiting {wait:.2f}s")
+                    await asyncio.sleep(wait)
+                    continue
+                self.requests.consume(1)
+                self.tokens.consume(tokens)
+                future.set_result(None)
+
+            # 1件通したセッションは列の最後へ回す
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+
+
+_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(name: str) -> Optional[RateLimiter]:
+    """モデルのレート制限を取得（上限が設定されていなければNone）"""
+    if name not in _limiters:
+        budget = RATE_BUDGETS.get(name)
+        if budget is None:
+            return None
+        _limiters[name] = RateLimiter(name, budget)
+    return _limiters[name]
+
+
+async def acquire(name: str, tokens: int = 0) -> None:
+    """モデル name の呼び出し枠を確保する（上限未設定なら即時に戻る）"""
+    limiter = get_rate_limiter(name)
+    if limiter is not None:
+        await limiter.acquire(tokens)
@@ -0,0 +1,210 @@
+"""
+外部API呼び出しの再試行・遮断サービス
+
+一時的なエラーを種類ごとの方針（回数・待機時間）で再試行する。
+待機時間は指数バックオフにジッターを加え、多数の呼び出しが同時に再送しないようにする。
+セッションごとに再試行回数の予算を設け、プロバイダーごとのサーキットブレーカーで
+障害中のAPIへの呼び出しを即座に失敗させる。
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+from google.api_core import exceptions as google_exceptions
+
+from services.rate_limit import current_session_id
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """エラーの種類ごとの再試行方針"""
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+    # エラーメッセージの「retry in N s」に従う（レート制限）
+    honor_retry_delay: bool = False
+
+
+# レート制限: サーバー指定の待機時間に従い、回数は多め
+RATE_LIMITED = "rate_limited"
+# 一時的な障害（503・タイムアウト・接続エラーなど）: 短い間隔から再試行
+UNAVAILABLE = "unavailable"
+
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    RATE_LIMITED: RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=60.0, honor_retry_delay=True),
+    UNAVAILABLE: RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=20.0),
+}
+
+# セッションあたりの再試行回数の上限（RETRY_BUDGET_WINDOW 秒ごとにリセット）
+RETRY_BUDGET_PER_SESSION = int(os.getenv("RETRY_BUDGET_PER_SESSION", "20"))
+RETRY_BUDGET_WINDOW = 600
+
+# 連続してこの回数失敗したプロバイダーへの呼び出しを止める
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# 止めてから試行を再開するまでの秒数
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+_RETRY_STATUS_CODES = {429: RATE_LIMITED, 500: UNAVAILABLE, 502: UNAVAILABLE, 503: UNAVAILABLE, 504: UNAVAILABLE}
+
+
+class CircuitOpenError(RuntimeError):
+    """プロバイダーが障害中のため呼び出しを行わなかった"""
+
+
+def parse_retry_delay(error_message: str) -> Optional[float]:
+    """エラーメッセージからリトライ待機時間を抽出"""
+    match = re.search(r'retry in (\d+(?:\.\d+)?)', str(error_message), re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def classify_error(error: Exception) -> Optional[str]:
+    """再試行すべきエラーの種類を返す（再試行しないエラーはNone）"""
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests, openai.RateLimitError)):
+        return RATE_LIMITED
+    if isinstance(error, google_exceptions.MethodNotImplemented):
+        return None
+    if isinstance(error, (
+        google_exceptions.ServerError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+        ConnectionError,
+        TimeoutError,
+        asyncio.TimeoutError,
+    )):
+        return UNAVAILABLE
+
+    # File API（googleapiclient）はHTTPステータス付きの例外を返す
+    status = getattr(getattr(error, "resp", None), "status", None)
+    return _RETRY_STATUS_CODES.get(status)
+
+
+def backoff_delay(policy: RetryPolicy, attempt: int, error: Exception) -> float:
+    """attempt 回目（0始まり）の失敗後の待機時間"""
+    if policy.honor_retry_delay:
+        retry_delay = parse_retry_delay(str(error))
+        if retry_delay is not None:
+            return retry_delay + random.uniform(0, policy.base_delay)
+    # 指数バックオフ + フルジッター
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** attempt))
+
+
+class RetryBudget:
+    """セッションごとの再試行回数の予算"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._spent: Dict[str, tuple] = {}
+
+    def try_spend(self, session_id: str) -> bool:
+        now = time.monotonic()
+        started, count = self._spent.get(session_id, (now, 0))
+        if now - started > self.window:
+            started, count = now, 0
+        if count >= self.limit:
+            return False
+        self._spent[session_id] = (started, count + 1)
+        return True
+
+
+class CircuitBreaker:
+    """連続失敗でプロバイダーへの呼び出しを一定時間止める"""
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    def before_call(self) -> None:
+        if self.opened_at is None:
+            return
+        if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_flight:
+            raise CircuitOpenError(f"{self.name} は一時的に利用できません（障害を検知したため呼び出しを停止中）")
+        # 停止時間が過ぎたら1件だけ試す（half-open）
+        self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"[{self.name}] Circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """判定に使えない結果（再試行しないエラー）で試行が終わった場合"""
+        self._trial_in_flight = False
+
+
+retry_budget = RetryBudget(RETRY_BUDGET_PER_SESSION, RETRY_BUDGET_WINDOW)
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    if provider not in _breakers:
+        _breakers[provider] = CircuitBreaker(provider, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+    return _breakers[provider]
+
+
+async def call_with_resilience(provider: str, func: Callable[[], Awaitable[T]]) -> T:
+    """
+    外部API呼び出し func を再試行・遮断付きで実行する
+
+    func は試行ごとに呼ばれるため、レート制限の待機なども func の中で行う。
+    """
+    breaker = get_circuit_breaker(provider)
+    attempt = 0
+
+    while True:
+        breaker.before_call()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            breaker.release_trial()
+            raise
+        except Exception as e:
+            kind = classify_error(e)
+            if kind is None:
+                breaker.release_trial()
+                raise
+            # レート制限はプロバイダーの障害ではないため遮断の判定に含めない
+            if kind == UNAVAILABLE:
+                breaker.record_failure()
+            else:
+                breaker.release_trial()
+
+            policy = RETRY_POLICIES[kind]
+            if attempt + 1 >= policy.max_attempts:
+                raise
+            if not retry_budget.try_spend(current_session_id.get()):
+                logger.warning(f"[{provider}] Retry budget exhausted for session")
+                raise
+
+            delay = backoff_delay(policy, attempt, e)
+            logger.warning(f"[{provider}] {type(e).__name__} ({kind}). Retrying in {delay:.1f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+
+        breaker.record_success()
+        return result
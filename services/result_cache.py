@@ -0,0 +1,192 @@
+"""
+解析結果キャッシュサービス
+
+文字起こし結果とスコーピング結果をSQLiteに保存し、同じ動画の再アップロードや
+エラー後の再試行で同じAPI呼び出しを繰り返さないようにする。
+合計サイズが上限を超えたら最終参照が古いものから削除する（LRU）。
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 保存先（サーバー再起動後も残るよう一時ディレクトリ直下のファイルに保存）
+RESULT_CACHE_PATH = os.getenv(
+    "RESULT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "hikitsugi_cache.sqlite3")
+)
+# 保存する結果の合計サイズ上限（バイト）。0でキャッシュ無効
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# キャッシュの種類
+TRANSCRIPT_NAMESPACE = "transcript"
+SCOPING_NAMESPACE = "scoping"
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """ファイル内容のSHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(*parts: str) -> str:
+    """文字列の組のSHA-256（区切りを含めてハッシュ化し、連結の曖昧さを避ける）"""
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode("utf-8")
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    サイズ上限付きのLRUキャッシュ（SQLite）
+
+    イベントループからは aget / aset / adelete を使う。
+    SQLiteの読み書き（ディスクI/O・コミット）は専用スレッドで行い、ループを止めない。
+    """
+
+    def __init__(self, path: str, max_bytes: int, table: str = "entries"):
+        self.path = path
+        self.max_bytes = max_bytes
+        # 用途ごとにテーブルを分け、サイズ上限と削除（LRU）を互いに影響させない
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 接続は1つでロックで直列化されるため、スレッドも1つで足りる
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result_cache")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """保存済みの値を取得（なければNone）"""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    f"SELECT value FROM {self.table} WHERE namespace = ? AND key = ?",
+                    (namespace, key)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    f"UPDATE {self.table} SET accessed = ? WHERE namespace = ? AND key = ?",
+                    (time.time(), namespace, key)
+                )
+                conn.commit()
+                return row[0]
+        except sqlite3.Error as e:
+            # キャッシュの不具合で解析を止めない
+            logger.warning(f"Result cache read failed: {e}")
+            return None
+
+    def set(self, namespace: str, key: str, value: str) -> None:
+        """値を保存し、上限を超えた分を古い順に削除"""
+        if not self.enabled:
+            return
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (namespace, key, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, value, size, time.time())
+                )
+                self._evict(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+    def delete(self, namespace: str, key: str) -> None:
+        """値を削除"""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(f"DELETE FROM {self.table} WHERE namespace = ? AND key = ?", (namespace, key))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache delete failed: {e}")
+
+    async def aget(self, namespace: str, key: str) -> Optional[str]:
+        """get の非同期版"""
+        if not self.enabled:
+            return None
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self.get, namespace, key)
+
+    async def aset(self, namespace: str, key: str, value: str) -> None:
+        """set の非同期版"""
+        if not self.enabled:
+            return
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self._executor, self.set, namespace, key, value)
+
+    async def adelete(self, namespace: str, key: str) -> None:
+        """delete の非同期版"""
+        if not self.enabled:
+            return
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self._executor, self.delete, namespace, key)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        expired = []
+        for namespace, key, size in conn.execute(
+            f"SELECT namespace, key, size FROM {self.table} ORDER BY accessed"
+        ):
+            if total <= self.max_bytes:
+                break
+            expired.append((namespace, key))
+            total -= size
+
+        conn.executemany(f"DELETE FROM {self.table} WHERE namespace = ? AND key = ?", expired)
+        logger.info(f"Result cache evicted {len(expired)} entries")
+
+
+result_cache = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES)
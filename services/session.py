@@ -1,11 +1,15 @@
 """
 セッション管理サービス
 """
+import os
 import time
+import asyncio
 from dataclasses import dataclass, field
 from typing import Optional
 from enum import Enum
 
+from frame_extractor import FrameSet, MediaInfo
+
 
 class ProcessingPhase(str, Enum):
     """処理フェーズ"""
@@ -25,6 +29,8 @@ class SessionData:
     filename: Optional[str] = None
     file_path: Optional[str] = None
     gemini_file: Optional[object] = None
+    gemini_segments: list = field(default_factory=list)  # 長い動画は全編の代わりに区間ごとにアップロード
+    media_info: Optional[MediaInfo] = None  # アップロード時に1回だけプローブ
 
     # ユーザー入力
     business_title: str = ""
@@ -36,9 +42,10 @@ class SessionData:
     user_policy: str = ""
     video_analysis: str = ""
     generated_document: str = ""
+    full_transcript: str = ""  # 全編の文字起こし（[MM:SS] 付き）
 
     # フレーム抽出結果
-    extracted_frames: list = field(default_factory=list)
+    extracted_frames: FrameSet = field(default_factory=FrameSet)
 
     # メタデータ
     created_at: float = field(default_factory=time.time)
@@ -58,11 +65,48 @@ class SessionData:
     # 動画アップロード状態
     upload_status: str = "pending"  # "pending", "uploading", "completed", "failed"
     upload_error: str = ""
+    upload_task: Optional[asyncio.Task] = None  # スコーピングと並行して実行
+
+    # 全編文字起こし（FULL_TRANSCRIPTION_ENABLED の場合のみ, スコーピングと並行して実行）
+    transcript_task: Optional[asyncio.Task] = None
 
     def update(self):
         """更新日時を更新"""
         self.updated_at = time.time()
 
+    async def wait_for_upload(self, timeout: Optional[float] = None) -> None:
+        """
+        動画アップロードの完了を待つ（成否は upload_status で確認する）
+
+        Raises:
+            asyncio.TimeoutError: timeout 秒以内に完了しなかった場合
+        """
+        if self.upload_task is None or self.upload_task.done():
+            return
+        # 待機側のタイムアウトでアップロード自体をキャンセルしない
+        await asyncio.wait_for(asyncio.shield(self.upload_task), timeout or UPLOAD_WAIT_TIMEOUT)
+
+    async def wait_for_transcript(self, timeout: Optional[float] = None) -> bool:
+        """
+        全編文字起こしの完了を待つ
+
+        文字起こしは補助情報のため、timeout 秒を過ぎたら待つのをやめて False を返す
+        （文字起こし自体は続行し、完了すれば以降の解析で使われる）。
+        """
+        if self.transcript_task is None or self.transcript_task.done():
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(self.transcript_task), timeout or TRANSCRIPT_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+# 詳細解析の開始時に動画アップロードの完了を待つ最大秒数
+UPLOAD_WAIT_TIMEOUT = float(os.getenv("UPLOAD_WAIT_TIMEOUT", "600"))
+# 詳細解析の開始時に全編文字起こしの完了を待つ最大秒数
+TRANSCRIPT_WAIT_TIMEOUT = float(os.getenv("TRANSCRIPT_WAIT_TIMEOUT", "300"))
+
 
 # インメモリセッションストア（本番ではRedis等に置き換え）
 _sessions: dict[str, SessionData] = {}
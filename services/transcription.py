@@ -0,0 +1,219 @@
+"""
+音声文字起こしサービス
+
+文字起こしバックエンドを共通インターフェースで扱い、環境変数で切り替える。
+高速だがハルシネーションの恐れがあるモデルと、低速だが堅牢なモデルを
+同時に呼び出すヘッジモードも提供する。
+"""
+import os
+import re
+import json
+import zlib
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Callable, List, Optional
+
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+from services import rate_limit
+from services.resilience import call_with_resilience
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# バックエンド設定
+#   openai: gpt-4o-transcribe（既定。ハルシネーションなし）
+#   groq: Groq Whisper（高速・低コストだがハルシネーションの恐れあり）
+#   hedged: groq と openai を同時に呼び、groq の結果が妥当ならそれを採用
+TRANSCRIPTION_PROVIDER = os.getenv("TRANSCRIPTION_PROVIDER", "openai")
+OPENAI_TRANSCRIPTION_MODEL = os.getenv("OPENAI_TRANSCRIPTION_MODEL", "gpt-4o-transcribe")
+GROQ_TRANSCRIPTION_MODEL = os.getenv("GROQ_TRANSCRIPTION_MODEL", "whisper-large-v3-turbo")
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+# Whisper系で報告されている定型ハルシネーション
+# （experiments/001_audio_transcription_benchmark/REPORT.md）
+HALLUCINATION_PHRASES = (
+    "ご視聴ありがとうございました",
+    "ご清聴ありがとうございました",
+    "チャンネル登録",
+)
+# 圧縮率がこの値を超えるテキストは同じ語句の繰り返しとみなす（Whisperの判定基準と同じ）
+HALLUCINATION_COMPRESSION_RATIO = 2.4
+# 同じ文がこの回数以上、かつ全体のこの割合以上を占める場合も繰り返しとみなす
+HALLUCINATION_REPEAT_COUNT = 3
+HALLUCINATION_REPEAT_RATIO = 0.3
+
+_SENTENCE_SPLIT_PATTERN = re.compile(r"[。．.!?！？\n]+")
+
+
+@dataclass
+class TranscriptSegment:
+    """文字起こし結果の1区間（時刻は音声ファイル先頭からの秒数）"""
+    start: float
+    end: float
+    text: str
+
+
+@dataclass
+class TranscriptionResult:
+    """文字起こし結果"""
+    text: str
+    provider: str
+    model: str
+    # 区間ごとの時刻を返すモデルのみ（それ以外は空）
+    segments: List[TranscriptSegment] = field(default_factory=list)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data: str) -> "TranscriptionResult":
+        values = json.loads(data)
+        values["segments"] = [TranscriptSegment(**seg) for seg in values.get("segments", [])]
+        return cls(**values)
+
+    def map_times(self, convert: Callable[[float], float]) -> "TranscriptionResult":
+        """区間の時刻を convert で変換した結果を返す（無音除去後の時刻を元音声の時刻に戻す等）"""
+        segments = [TranscriptSegment(convert(seg.start), convert(seg.end), seg.text) for seg in self.segments]
+        return TranscriptionResult(self.text, self.provider, self.model, segments)
+
+
+def looks_hallucinated(text: str) -> bool:
+    """定型句の繰り返しなど、ハルシネーションの兆候があるか"""
+    stripped = text.strip()
+    if not stripped:
+        return False
+
+    if any(stripped.count(phrase) >= 2 for phrase in HALLUCINATION_PHRASES):
+        return True
+
+    encoded = stripped.encode("utf-8")
+    if len(encoded) >= 100 and len(encoded) / len(zlib.compress(encoded)) > HALLUCINATION_COMPRESSION_RATIO:
+        return True
+
+    sentences = [s.strip() for s in _SENTENCE_SPLIT_PATTERN.split(stripped) if s.strip()]
+    if sentences:
+        _, count = Counter(sentences).most_common(1)[0]
+        if count >= HALLUCINATION_REPEAT_COUNT and count / len(sentences) >= HALLUCINATION_REPEAT_RATIO:
+            return True
+
+    return False
+
+
+class TranscriptionProvider(ABC):
+    """文字起こしバックエンドのインターフェース"""
+
+    name: str = ""
+    model: str = ""
+
+    @abstractmethod
+    async def transcribe(self, audio_path: str, language: str = "ja") -> TranscriptionResult:
+        """音声ファイルを文字起こしする"""
+
+
+class OpenAICompatibleProvider(TranscriptionProvider):
+    """OpenAI互換の /audio/transcriptions APIを使うバックエンド"""
+
+    def __init__(self, name: str, model: str, client: AsyncOpenAI):
+        self.name = name
+        self.model = model
+        self.client = client
+
+    async def transcribe(self, audio_path: str, language: str = "ja") -> TranscriptionResult:
+        # Whisper系は区間ごとの時刻を返せる
+        with_segments = self.model.startswith("whisper")
+
+        async def call():
+            await rate_limit.acquire(self.model)
+            with open(audio_path, "rb") as f:
+                return await self.client.audio.transcriptions.create(
+                    model=self.model,
+                    file=f,
+                    response_format="verbose_json" if with_segments else "json",
+                    language=language
+                )
+
+        response = await call_with_resilience(self.name, call)
+
+        segments = [
+            TranscriptSegment(seg.start, seg.end, seg.text.strip())
+            for seg in (getattr(response, "segments", None) or [])
+        ]
+        return TranscriptionResult(response.text, self.name, self.model, segments)
+
+
+class HedgedProvider(TranscriptionProvider):
+    """
+    高速なバックエンドと堅牢なバックエンドを同時に呼び出す
+
+    高速側の結果がハルシネーションチェックを通ればそれを採用して堅牢側を
+    キャンセルし、通らない・失敗した場合は堅牢側の結果を待つ。
+    """
+
+    def __init__(self, fast: TranscriptionProvider, robust: TranscriptionProvider):
+        self.fast = fast
+        self.robust = robust
+        self.name = f"hedged({fast.name}+{robust.name})"
+        self.model = f"{fast.model}|{robust.model}"
+
+    async def transcribe(self, audio_path: str, language: str = "ja") -> TranscriptionResult:
+        fast_task = asyncio.create_task(self.fast.transcribe(audio_path, language))
+        robust_task = asyncio.create_task(self.robust.transcribe(audio_path, language))
+
+        try:
+            done, _ = await asyncio.wait({fast_task, robust_task}, return_when=asyncio.FIRST_COMPLETED)
+
+            if robust_task in done and not robust_task.exception():
+                return robust_task.result()
+
+            try:
+                result = await fast_task
+                if not looks_hallucinated(result.text):
+                    logger.info(f"[{self.fast.name}] Fast transcription accepted")
+                    return result
+                logger.warning(f"[{self.fast.name}] Hallucination suspected. Waiting for {self.robust.name}")
+            except Exception as e:
+                logger.warning(f"[{self.fast.name}] Fast transcription failed: {e}")
+
+            return await robust_task
+
+        finally:
+            for task in (fast_task, robust_task):
+                if not task.done():
+                    task.cancel()
+
+
+# 再試行は services.resilience で行うため、SDK側の再試行は無効にする
+def _openai_provider() -> TranscriptionProvider:
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return OpenAICompatibleProvider("openai", OPENAI_TRANSCRIPTION_MODEL, client)
+
+
+def _groq_provider() -> TranscriptionProvider:
+    client = AsyncOpenAI(api_key=os.getenv("GROQ_API_KEY"), base_url=GROQ_BASE_URL, max_retries=0)
+    return OpenAICompatibleProvider("groq", GROQ_TRANSCRIPTION_MODEL, client)
+
+
+_PROVIDER_FACTORIES = {
+    "openai": _openai_provider,
+    "groq": _groq_provider,
+    "hedged": lambda: HedgedProvider(_groq_provider(), _openai_provider()),
+}
+
+_provider: Optional[TranscriptionProvider] = None
+
+
+def get_transcription_provider() -> TranscriptionProvider:
+    """設定されたバックエンドを取得（初回のみ生成）"""
+    global _provider
+    if _provider is None:
+        factory = _PROVIDER_FACTORIES.get(TRANSCRIPTION_PROVIDER)
+        if factory is None:
+            raise ValueError(f"未対応の文字起こしバックエンドです: {TRANSCRIPTION_PROVIDER}")
+        _provider = factory()
+    return _provider
@@ -664,46 +664,47 @@ async function handleAnalysisComplete() {
     }
 }
 
-async function generateDocument() {
+function generateDocument() {
     console.log('Generating document...');
 
-    try {
-        // POST /api/generate-document でドキュメント生成
-        const response = await fetch('/api/generate-document', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                session_id: state.sessionId
-            })
-        });
+    // GET /api/document-stream でドキュメントを生成しながら受信
+    return new Promise((resolve) => {
+        const source = new EventSource(`/api/document-stream/${state.sessionId}`);
+        state.generatedDocument = '';
 
-        if (!response.ok) {
-            throw new Error(`Document generation failed: ${response.status}`);
-        }
+        source.addEventListener('chunk', (e) => {
+            const data = JSON.parse(e.data);
+            state.generatedDocument += data.text;
+            elements.phase2Task.textContent = `ドキュメント生成中... (${state.generatedDocument.length}文字)`;
+        });
 
-        const data = await response.json();
+        source.addEventListener('done', () => {
+            source.close();
+            console.log('Document generated successfully');
 
-        // 生成されたドキュメントをstateに保存
-        state.generatedDocument = data.document;
-        console.log('Document generated successfully');
+            // UI更新（完了）
+            state.phase2Progress = 100;
+            elements.phase2ProgressBar.style.width = '100%';
+            elements.phase2ProgressText.textContent = '100%';
+            updatePhase2Stages('generation');
+            elements.phase2Task.textContent = 'ドキュメント生成完了';
 
-        // UI更新（完了）
-        state.phase2Progress = 100;
-        elements.phase2ProgressBar.style.width = '100%';
-        elements.phase2ProgressText.textContent = '100%';
-        updatePhase2Stages('generation');
-        elements.phase2Task.textContent = 'ドキュメント生成完了';
-
-        // Complete画面へ自動遷移（1秒後）
-        setTimeout(() => {
-            showStep('complete');
-            setupCompleteUI();
-        }, 1000);
+            // Complete画面へ自動遷移（1秒後）
+            setTimeout(() => {
+                showStep('complete');
+                setupCompleteUI();
+            }, 1000);
+            resolve();
+        });
 
-    } catch (error) {
-        console.error('Failed to generate document:', error);
-        showErrorMessage('ドキュメント生成に失敗しました');
-    }
+        // サーバーからのerrorイベントと接続エラーの両方で呼ばれる（自動再接続で再生成させない）
+        source.addEventListener('error', (e) => {
+            source.close();
+            console.error('Failed to generate document:', e.data || e);
+            showErrorMessage('ドキュメント生成に失敗しました');
+            resolve();
+        });
+    });
 }
 
 function updatePhase2Stages(currentStage) {
@@ -758,18 +759,11 @@ function setupCompleteUI() {
 function setupCompleteStep() {
     elements.downloadBtn.addEventListener('click', async () => {
         try {
-            const response = await fetch('/api/generate-document', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    session_id: state.sessionId,
-                }),
-            });
+            // 保存済み（表示中）のドキュメントを、画像をBase64で埋め込んだ単体ファイルとして取得
+            const response = await fetch(`/api/document/${state.sessionId}?image_format=base64`);
 
             if (!response.ok) {
-                throw new Error('ドキュメント生成に失敗しました');
+                throw new Error('ドキュメントの取得に失敗しました');
             }
 
             const data = await response.json();